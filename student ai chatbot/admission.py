@@ -0,0 +1,101 @@
+"""Admission control: per-client rate limits and a bounded concurrency gate.
+
+A request is admitted in two steps. ``TokenBuckets`` gives every client a
+bucket of ``burst`` tokens refilled at ``rate`` per second; a client with an
+empty bucket is told how long to wait. ``ConcurrencyGate`` then lets at most
+``limit`` requests work at once. A few more may wait up to ``timeout`` seconds
+for a free slot; beyond that they are turned away immediately. Rejections are
+cheap, so a burst costs the rejected clients a fast error instead of costing
+everyone a long queue.
+
+Both live in one process. Under a pre-fork server every worker has its own
+buckets and gate, so server-wide limits are the per-worker ones times the
+number of workers.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Clients with a bucket in memory; the least recently seen are forgotten first
+MAX_CLIENTS = 65536
+
+
+class TokenBuckets:
+    """Per-client token buckets, bounded to ``max_clients`` entries."""
+
+    __slots__ = ("rate", "burst", "max_clients", "_buckets", "_lock")
+
+    def __init__(self, rate: float, burst: int, max_clients: int = MAX_CLIENTS):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> [tokens, time of last refill]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, client, now: float = None) -> float:
+        """Spend one of ``client``'s tokens: 0.0 if it had one, else seconds until it will."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                # a forgotten client comes back with a full bucket, as an idle one would have
+                bucket = self._buckets[client] = [float(self.burst), now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+
+class ConcurrencyGate:
+    """At most ``limit`` holders at once, with up to ``queue`` waiters for ``timeout`` seconds."""
+
+    __slots__ = ("limit", "queue", "timeout", "active", "waiting", "_cond")
+
+    def __init__(self, limit: int, queue: int = 0, timeout: float = 0.0):
+        if limit < 1 or queue < 0:
+            raise ValueError("limit must be at least 1 and queue not negative")
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    def acquire(self):
+        """``"admitted"`` or ``"queued"`` (admitted after waiting), or None if rejected.
+
+        Every admission must be paired with ``release()``.
+        """
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                return "admitted"
+            if self.waiting >= self.queue:
+                return None
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self.active < self.limit, self.timeout):
+                    return None
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            return "queued"
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
@@ -1,758 +1,869 @@
-from flask import Flask, render_template, request
-
-app = Flask(__name__)
-
-# Branch -> subjects mapping
-BRANCH_SUBJECTS = {
-    "Computer Science": [
-        "Data Structures", 
-        "Operating Systems", 
-        "Algorithms", 
-        "Computer Networks",
-        "Database Management Systems",
-        "Web Development",
-        "Artificial Intelligence",
-        "Software Engineering",
-        "Compiler Design",
-        "Discrete Mathematics"
-    ]
+import time
+
+# Start of this process's startup timeline (see STARTUP); taken before the imports below
+IMPORT_STARTED = time.perf_counter()
+
+import atexit
+import functools
+import gc
+import hashlib
+import json
+import logging
+import math
+import os
+import secrets
+import threading
+
+from flask import (
+    Blueprint, Flask, abort, current_app, g, jsonify, make_response, redirect, render_template, request,
+    stream_with_context, url_for,
+)
+from werkzeug.exceptions import (
+    LengthRequired, RequestEntityTooLarge, RequestURITooLarge, ServiceUnavailable, TooManyRequests,
+)
+
+import metrics
+from admission import ConcurrencyGate, TokenBuckets
+from assets import compress_response, load_static_assets, negotiate
+from cache import LRUCache, TTLCache
+from knowledge import RESIDENT_SUBJECTS, Answer, clip_doubt, is_follow_up, normalize_doubt
+from querylog import QueryLog
+from render import FORMATS
+from shards import FORMAT_VERSION, SHARD_DIR
+from snapshot import SnapshotHolder
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+log = logging.getLogger(__name__)
+
+bp = Blueprint('solver', __name__)
+
+# Settings read by create_app(); each can be overridden by the environment variable
+# of the same name or by the ``config`` mapping passed to create_app()
+DEFAULT_CONFIG = {
+    # seconds between checks of the knowledge sources; 0 disables hot reload
+    'KNOWLEDGE_RELOAD_INTERVAL': 2.0,
+    # decoded subjects kept in memory; the rest of the catalog stays memory-mapped on disk
+    'KNOWLEDGE_RESIDENT_SUBJECTS': RESIDENT_SUBJECTS,
+    'KNOWLEDGE_BUILD_DIR': SHARD_DIR,
+    # answer the sample doubts at startup, so caches are warm (and shared after fork)
+    'WARM_CACHES': True,
+    # per-client token bucket for /: sustained requests per second and burst size; 0 disables
+    'RATE_LIMIT_PER_SECOND': 5.0,
+    'RATE_LIMIT_BURST': 20,
+    # requests answered at once by /, how many more may wait for a slot, and for how long
+    'MAX_CONCURRENT_ANSWERS': 16,
+    'ADMISSION_QUEUE': 32,
+    'ADMISSION_QUEUE_TIMEOUT': 0.5,
+    # conversations remembered for follow-up doubts, and seconds of inactivity before one is forgotten
+    'SESSION_MAX_ENTRIES': 10000,
+    'SESSION_TTL': 1800.0,
+    # append answered doubts to this JSON-lines file (see querylog.py); empty disables
+    'QUERY_LOG': '',
+    # log the doubt text; False logs only a hash of it
+    'QUERY_LOG_TEXT': True,
 }
 
-# Example doubts for subject quick-fill
-SAMPLE_DOUBTS = {
-    "Data Structures": [
-        "How does a binary search tree work?",
-        "When should I use a hash table vs array?",
-        "Explain tree traversal methods",
-        "What is the difference between stack and queue?",
-        "How does a linked list work?",
-        "What are heaps and priority queues?"
-    ],
-    "Operating Systems": [
-        "What is context switching?",
-        "How do semaphores prevent race conditions?",
-        "Explain virtual memory briefly",
-        "What is a process vs thread?",
-        "How does page replacement work?",
-        "What is inter-process communication?"
-    ],
-    "Algorithms": [
-        "What's the difference between merge sort and quick sort?",
-        "Explain dynamic programming with an example",
-        "When to use greedy algorithms?",
-        "What is binary search and how is it different from linear search?",
-        "Explain the divide and conquer approach",
-        "What is backtracking with examples?"
-    ],
-    "Computer Networks": [
-        "What is the difference between TCP and UDP?",
-        "How does routing work at a high level?",
-        "What does HTTP do?",
-        "Explain the OSI model layers",
-        "What is IP and how does IP addressing work?",
-        "What is DNS and how does it work?"
-    ],
-    "Database Management Systems": [
-        "What are ACID properties and why are they important?",
-        "Explain normalization and its forms",
-        "What is the difference between SQL and NoSQL?",
-        "What is a primary key and foreign key?",
-        "Explain joins in database queries",
-        "What is indexing and why is it important?"
-    ],
-    "Web Development": [
-        "What is the difference between frontend and backend?",
-        "Explain REST API principles",
-        "How does HTTP request-response work?",
-        "What are cookies and sessions?",
-        "Explain MVC architecture",
-        "What is CORS and why is it important?"
-    ],
-    "Artificial Intelligence": [
-        "What is machine learning and its types?",
-        "Explain supervised vs unsupervised learning",
-        "What is neural network and deep learning?",
-        "What is overfitting and underfitting?",
-        "Explain cluster analysis in machine learning",
-        "What are activation functions in neural networks?"
-    ],
-    "Software Engineering": [
-        "What are SDLC models and their phases?",
-        "Explain design patterns with examples",
-        "What is agile methodology?",
-        "What is version control and why is it important?",
-        "Explain unit testing and test-driven development",
-        "What is CI/CD pipeline?"
-    ],
-    "Compiler Design": [
-        "Explain lexical analysis and tokenization",
-        "What is the role of parser in compilation?",
-        "What is code generation?",
-        "What is semantic analysis in compilation?",
-        "Explain the symbol table in compilers",
-        "What is intermediate representation?"
-    ],
-    "Discrete Mathematics": [
-        "What are sets and set operations?",
-        "Explain graph theory basics",
-        "What is combinatorics and probability?",
-        "What are boolean algebra and logic gates?",
-        "Explain trees in discrete mathematics",
-        "What is mathematical induction?"
-    ]
+# Process-wide state, built once by create_app() and shared by every app instance.
+# Under a pre-fork server it is built in the master, so workers share its pages.
+STATIC_ASSETS = None
+ASSETS_BY_HASH = None
+# Subject shards, fragments and catalog, compiled from knowledge/ into one immutable
+# snapshot. Handlers read SNAPSHOTS.current once per request; edits to the JSON
+# sources are picked up by a polling watcher and swapped in atomically.
+SNAPSHOTS = None
+RELOAD_INTERVAL = 0.0
+# Set by start_worker() once this process is ready to serve
+READY = False
+# Admission control for /, from the RATE_LIMIT_* and *_ANSWERS/ADMISSION_* settings
+RATE_LIMITER = None
+ANSWER_GATE = None
+# session id -> (selected branch, selected subject, topic branch, topic subject, topic id)
+# of the last answered topic, for follow-ups. Only known subjects are stored, so an
+# entry is a few short strings; SESSION_MAX_ENTRIES bounds the total.
+SESSIONS = None
+SESSION_COOKIE = 'doubt_session'
+# Written from a background thread; requests only drop an entry into its ring buffer
+QUERY_LOG = None
+# secrets.token_urlsafe(16) is always this long; other cookie values are ignored
+SESSION_ID_CHARS = 22
+
+# Startup timeline of this process, in milliseconds. ready_ms and
+# time_to_first_request_ms count from IMPORT_STARTED, or from the fork for a
+# pre-forked worker; the rest are durations. Logged once and served by /readyz.
+STARTUP = {
+    'pid': os.getpid(),
+    'import_ms': None,
+    'create_app_ms': None,
+    'ready_ms': None,
+    'first_request_ms': None,
+    'time_to_first_request_ms': None,
 }
+_startup_origin = IMPORT_STARTED
+_startup_lock = threading.Lock()
 
 
-def make_list(items):
-    return "<ul>" + "".join(f"<li>{item}</li>" for item in items) + "</ul>"
+def _static_page_salt() -> str:
+    """Hash of the page template, static assets and code, folded into every page ETag.
+
+    The code is every module next to this one plus the shard format, so a deploy
+    that only changes how doubts are classified (thresholds, ranking, spelling)
+    still changes every ETag.
+    """
+    digest = hashlib.sha256()
+    with open(os.path.join(ROOT, 'templates', 'index.html'), 'rb') as fh:
+        digest.update(fh.read())
+    for name in sorted(ASSETS_BY_HASH):
+        digest.update(name.encode('utf-8'))
+    for name in sorted(n for n in os.listdir(ROOT) if n.endswith('.py')):
+        with open(os.path.join(ROOT, name), 'rb') as fh:
+            digest.update(name.encode('utf-8') + b'\0' + fh.read())
+    digest.update(f'format {FORMAT_VERSION}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def __getattr__(name):
+    # BRANCH_SUBJECTS / SAMPLE_DOUBTS always reflect the current snapshot
+    if name == 'BRANCH_SUBJECTS':
+        return SNAPSHOTS.current.branch_subjects
+    if name == 'SAMPLE_DOUBTS':
+        return SNAPSHOTS.current.sample_doubts
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Whole-response memo keyed on (snapshot version, branch, subject, stripped doubt);
+# entries from an older snapshot are never hit again and simply age out
+RESPONSE_CACHE_SIZE = 2048
+RESPONSE_CACHE = LRUCache(RESPONSE_CACHE_SIZE)
+
+DEFAULT_BRANCH = "Computer Science"
+DEFAULT_SUBJECT = "Data Structures"
+
+# In-process metrics, exposed at /metrics in Prometheus text format
+REQUEST_SECONDS = metrics.Histogram(
+    metrics.REGISTRY, "doubt_request_seconds", "Whole-request latency by route.", ("route", "method"),
+)
+PHASE_SECONDS = metrics.Histogram(
+    metrics.REGISTRY, "doubt_phase_seconds", "Time spent answering (classify) and in render_template (render) for / and /answer.",
+    ("phase",),
+)
+TOPIC_HITS = metrics.Counter(
+    metrics.REGISTRY, "doubt_topic_hits_total", "Answers served per topic.", ("branch", "subject", "topic"),
+)
+CLASSIFICATIONS = metrics.Counter(
+    metrics.REGISTRY, "doubt_classifications_total",
+    "Answers per subject by outcome: matched a topic, subject overview, or generic fallback.",
+    ("subject", "outcome"),
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_response_cache_hits_total", "Response cache hits.",
+    lambda: RESPONSE_CACHE.hits, kind="counter",
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_response_cache_misses_total", "Response cache misses.",
+    lambda: RESPONSE_CACHE.misses, kind="counter",
+)
+metrics.Callback(metrics.REGISTRY, "doubt_response_cache_size", "Entries in the response cache.", lambda: len(RESPONSE_CACHE))
+metrics.Callback(
+    metrics.REGISTRY, "doubt_knowledge_generation", "Generation of the serving knowledge snapshot.",
+    lambda: SNAPSHOTS.current.generation,
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_knowledge_build_seconds", "Build time of the serving knowledge snapshot.",
+    lambda: SNAPSHOTS.current.build_seconds,
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_knowledge_resident_subjects", "Subjects decoded and held in memory.",
+    lambda: SNAPSHOTS.current.knowledge.resident_stats()["size"],
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_knowledge_subject_loads_total", "Subjects decoded from shards in this snapshot.",
+    lambda: SNAPSHOTS.current.knowledge.resident_stats()["misses"], kind="counter",
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_knowledge_reloads_total", "Knowledge snapshots swapped in after a source change.",
+    lambda: SNAPSHOTS.reloads, kind="counter",
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_knowledge_reload_failures_total", "Rebuilds rejected because the sources were invalid.",
+    lambda: SNAPSHOTS.failures, kind="counter",
+)
+ADMISSIONS = metrics.Counter(
+    metrics.REGISTRY, "doubt_admission_total",
+    "Requests to / by outcome: admitted, queued (admitted after waiting), rate_limited (429) or overloaded (503).",
+    ("outcome",),
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_admission_in_flight", "Requests to / being answered now.",
+    lambda: ANSWER_GATE.active if ANSWER_GATE else 0,
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_admission_waiting", "Requests to / waiting for a free slot.",
+    lambda: ANSWER_GATE.waiting if ANSWER_GATE else 0,
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_rate_limit_clients", "Clients with a rate-limit bucket in memory.",
+    lambda: len(RATE_LIMITER) if RATE_LIMITER else 0,
+)
+FOLLOW_UPS = metrics.Counter(
+    metrics.REGISTRY, "doubt_follow_ups_total", "Doubts answered from the previous topic of their conversation.",
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_sessions", "Conversations remembered for follow-up doubts.",
+    lambda: len(SESSIONS) if SESSIONS else 0,
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_query_log_written_total", "Query log lines written.",
+    lambda: QUERY_LOG.written if QUERY_LOG else 0, kind="counter",
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_query_log_dropped_total", "Query log entries dropped because the buffer was full.",
+    lambda: QUERY_LOG.dropped if QUERY_LOG else 0, kind="counter",
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_startup_ready_seconds", "Time from process (or worker) start until ready to serve.",
+    lambda: (STARTUP['ready_ms'] or 0) / 1000,
+)
+metrics.Callback(
+    metrics.REGISTRY, "doubt_time_to_first_request_seconds",
+    "Time from process (or worker) start until the first response was finished; 0 until then.",
+    lambda: (STARTUP['time_to_first_request_ms'] or 0) / 1000,
+)
+
+# Largest form body (POST) or query string (GET) accepted by /; longer doubts are
+# clipped to knowledge.MAX_DOUBT_CHARS anyway, this just stops reading early
+MAX_FORM_BYTES = 16 * 1024
+# Limits for POST /api/solve
+MAX_BATCH_ITEMS = 500
+MAX_BATCH_BYTES = 1024 * 1024
+# Per-line limit for POST /api/solve/stream (NDJSON, no limit on line count)
+MAX_STREAM_LINE_BYTES = 64 * 1024
+# Completions per /api/suggest response, and seconds a browser may reuse one
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_AGE = 300
 
 
 def get_response(branch: str, subject: str, doubt: str) -> str:
     """Produce an HTML explanation based on the provided branch, subject and free‑text doubt.
 
     This function uses simple rule-based logic (no external calls or databases).
-    Keywords inside the student's doubt help choose which subtopic to elaborate; otherwise
-    a standard description for the subject is returned. The output is a string containing
-    HTML so it can be safely rendered using ``{{ response|safe }}`` in the template.
+    Keywords inside the student's doubt pick a topic from the knowledge base; otherwise
+    the subject overview (or the generic fallback) is returned. The output is a string
+    containing HTML so it can be safely rendered using ``{{ response|safe }}`` in the template.
+    Topic bodies are pre-rendered, and whole responses are memoized per doubt.
     """
+    record, response = answer(SNAPSHOTS.current, branch, subject, doubt)
+    record_topic(record.topic)
+    return response
 
-    d = (doubt or "").strip()
-    dl = d.lower()
 
-    # echo the question for clarity
-    intro = (
-        f"<p class=\"response-question\"><strong>Q:</strong> {d}</p>"
-        f"<p class=\"response-intro\">Hi there! As your friendly engineering professor, here is a clear, concise explanation "
-        f"for your doubt about <strong>{subject}</strong> in <strong>{branch}</strong>.</p>"
-    )
+def answer(snap, branch: str, subject: str, doubt: str, fmt: str = "html"):
+    """``(Answer, rendered)`` for a doubt in ``fmt`` (see ``render.FORMATS``), through
+    the response cache; records no metrics. Only the requested format is rendered."""
+    d = clip_doubt(doubt or "")
+    key = (snap.version, branch, subject, d, fmt)
+    cached = RESPONSE_CACHE.get(key)
+    if cached is not None:
+        return cached
 
-    # default values
-    definition = "This topic covers fundamental ideas that engineers encounter in their courses and work."
-    examples = [
-        "A general engineering example illustrating the idea.",
-        "Another applied scenario where this concept appears."
-    ]
-    industry = "Core engineering disciplines apply these principles across multiple industries."
-    keywords_list = ["core", "fundamental"]
-    summary = "This explanation should give you a grasp of the underlying concept so you can explore further."
-
-    if branch == "Computer Science":
-        if subject == "Algorithms":
-            definition = (
-                "Algorithms are step-by-step procedures to solve computational problems with measurable resources."
-            )
-            if any(k in dl for k in ["sort", "merge", "quick", "complexity"]):
-                examples = [
-                    "Sorting large datasets for database indexing.",
-                    "Choosing the right sort for memory-limited devices."
-                ]
-                keywords_list = ["time complexity", "space complexity", "divide and conquer", "greedy"]
-                industry = "Search engines, data processing, and performance-critical software rely on algorithmic choices."
-                summary = "Pick algorithms by correctness and complexity; test on realistic inputs."
-            elif any(k in dl for k in ["dynamic", "dp", "memo"]):
-                examples = [
-                    "Sequence alignment in bioinformatics using dynamic programming.",
-                    "Optimizing resource allocation in software using memoization."
-                ]
-                keywords_list = ["dynamic programming", "overlapping subproblems", "optimal substructure"]
-                industry = "Optimization tasks in finance, logistics, and machine systems often use DP techniques."
-                summary = "Dynamic programming transforms exponential solutions into efficient ones by reusing results."
-            elif any(k in dl for k in ["binary", "search", "linear"]):
-                examples = [
-                    "Finding a contact in a sorted phone book using binary search.",
-                    "Server load balancing selecting best resource using binary search.",
-                    "Linear search through a to-do list to find an item."
-                ]
-                keywords_list = ["binary search", "O(log n)", "sorted", "divide and conquer"]
-                industry = "Database indexes and search engines rely on binary search for fast lookups."
-                summary = "Binary search is exponentially faster than linear on sorted data."
-            elif any(k in dl for k in ["divide", "conquer", "merge", "recursive"]):
-                examples = [
-                    "Merge sort divides arrays, conquers each half, then merges results.",
-                    "File system traversal recursively explores directory trees."
-                ]
-                keywords_list = ["divide and conquer", "recursion", "subproblem", "combine"]
-                industry = "Parallel processing, big data, and system algorithms use divide-and-conquer."
-                summary = "Divide-and-conquer breaks hard problems into simpler identical subproblems."
-            elif any(k in dl for k in ["backtrack", "explore", "constraint", "pruning"]):
-                examples = [
-                    "N-Queens problem explores placements and backtracks on conflicts.",
-                    "Sudoku solvers try number placements and undo invalid ones."
-                ]
-                keywords_list = ["backtracking", "constraint satisfaction", "pruning", "search tree"]
-                industry = "Constraint solvers, game AI, and combinatorial optimization use backtracking."
-                summary = "Backtracking systematically explores choices and undoes failed attempts."
-            else:
-                examples = [
-                    "Greedy algorithms selecting locally best options for global problems.",
-                    "Graph algorithms finding connected components or shortest paths."
-                ]
-                keywords_list = ["algorithm", "optimization", "efficiency", "correctness"]
-                industry = "Every software system relies on choosing the right algorithm for the task."
-        elif subject == "Computer Networks":
-            definition = (
-                "Computer Networks enable systems to exchange data using protocols, addressing, and routing."
-            )
-            if any(k in dl for k in ["tcp", "udp", "http"]):
-                examples = [
-                    "Streaming video uses UDP for low-latency delivery.",
-                    "Web browsing relies on TCP and HTTP for reliable transfers."
-                ]
-                keywords_list = ["protocol", "packet", "router", "latency", "throughput"]
-                industry = "Cloud services, telecom, and distributed systems depend on robust networking."
-                summary = "Protocols and layering abstract network complexity and ensure reliable communication."
-            elif any(k in dl for k in ["osi", "layer", "model", "architecture"]):
-                examples = [
-                    "HTTP operates at Layer 7; IP at Layer 3; Ethernet at Layer 2.",
-                    "Firewalls inspect packets at different OSI layers for security."
-                ]
-                keywords_list = ["OSI model", "seven layers", "physical", "network", "application"]
-                industry = "Network engineers use the OSI model to troubleshoot and design systems."
-                summary = "OSI model abstracts networking into 7 layers; each has protocols and functions."
-            elif any(k in dl for k in ["dns", "domain", "name resolution", "lookup"]):
-                examples = [
-                    "Typing google.com triggers DNS to resolve it to an IP address.",
-                    "DNS caching at ISPs speeds up repeated lookups."
-                ]
-                keywords_list = ["DNS", "domain name", "resolution", "record", "nameserver"]
-                industry = "DNS is critical infrastructure; performance and security are paramount."
-                summary = "DNS translates human-readable names to IP addresses via hierarchical lookup."
-            elif any(k in dl for k in ["ip", "address", "ipv4", "ipv6", "routing"]):
-                examples = [
-                    "IP routing tables guide packets to correct networks.",
-                    "IPv6 addresses provide far more address space than IPv4."
-                ]
-                keywords_list = ["IP address", "routing", "subnet", "gateway", "CIDR"]
-                industry = "ISPs and data centers carefully manage IP allocation and routing."
-                summary = "IP addresses identify devices; routing tables guide traffic to destinations."
-            else:
-                examples = [
-                    "Network protocols standardizing communication between devices.",
-                    "Routers and switches forwarding data based on addresses."
-                ]
-                keywords_list = ["network", "communication", "protocol", "routing"]
-                industry = "Networking is the backbone of the digital world."
-
-        elif subject == "Data Structures":
-            definition = (
-                "Data Structures are organized ways to store and manage data so algorithms can access and "
-                "modify it efficiently."
-            )
-            if any(k in dl for k in ["tree", "binary", "bst", "trie"]):
-                examples = [
-                    "Routing tables in networks often use tree-like structures for prefix matching.",
-                    "File system directories are represented as trees for hierarchical organization."
-                ]
-                keywords_list = ["tree", "node", "root", "leaf", "traversal"]
-                industry = (
-                    "Search engines, databases, and compilers use tree structures for parsing, indexing, and fast lookups."
-                )
-                summary = "Trees organize hierarchical data; traverse and balance them for performance."
-            elif any(k in dl for k in ["hash", "hash table", "hash map"]):
-                examples = [
-                    "Caching DNS lookups using hash tables for O(1) average retrieval.",
-                    "Python dictionaries internally use hash tables for fast lookups."
-                ]
-                keywords_list = ["hash function", "collision", "load factor", "hash table", "dictionary"]
-                industry = "Databases, caching layers, and indexing engines rely heavily on hash tables."
-                summary = "Hash tables provide fast average-case lookups; handle collisions carefully."
-            elif any(k in dl for k in ["graph", "dfs", "bfs", "shortest"]):
-                examples = [
-                    "Road and traffic networks model intersections as graph nodes and roads as edges.",
-                    "Social networks model users and their relationships using graphs."
-                ]
-                keywords_list = ["graph", "vertex", "edge", "path", "connectivity"]
-                industry = "Transportation planning, recommendation systems, and network analysis rely on graphs."
-                summary = "Graphs model pairwise relationships; use traversals and algorithms to extract insights."
-            elif any(k in dl for k in ["stack", "queue", "difference"]):
-                examples = [
-                    "Browser back button uses a stack to track visited pages.",
-                    "CPU scheduling uses queues to manage ready processes."
-                ]
-                keywords_list = ["LIFO", "FIFO", "push", "pop", "enqueue", "dequeue"]
-                industry = "Operating systems and memory management heavily use stacks and queues."
-                summary = "Stack is LIFO; queue is FIFO. Choose based on needed access pattern."
-            elif any(k in dl for k in ["linked", "link", "pointer"]):
-                examples = [
-                    "Undo/redo functionality in editors uses doubly linked lists.",
-                    "LRU cache eviction uses doubly linked lists for efficient memory management."
-                ]
-                keywords_list = ["node", "pointer", "singly linked", "doubly linked", "circular"]
-                industry = "Memory management and dynamic data manipulation use linked lists extensively."
-                summary = "Linked lists excel at insertion/deletion; arrays at random access trade-offs exist."
-            elif any(k in dl for k in ["heap", "priority"]):
-                examples = [
-                    "Priority queues in OS schedulers use heaps to select next process.",
-                    "Dijkstra's algorithm uses min-heaps to find shortest paths efficiently."
-                ]
-                keywords_list = ["heap", "priority queue", "min-heap", "max-heap", "heapify"]
-                industry = "Real-time systems and game engines use heaps for efficient priority management."
-                summary = "Heaps maintain priority efficiently; use for top-k queries and scheduling."
-            else:
-                examples = [
-                    "Using arrays to store sensor readings in embedded systems.",
-                    "Hash tables powering fast lookups in caches and key-value stores."
-                ]
-                keywords_list = ["array", "list", "stack", "queue", "hash table"]
-                industry = "Databases, caching, and system internals depend on efficient data structures."
-
-        elif subject == "Operating Systems":
-            definition = (
-                "An Operating System (OS) manages hardware and software resources, providing services to programs "
-                "and users."
-            )
-            if any(k in dl for k in ["process", "context", "scheduling"]):
-                examples = [
-                    "A scheduler deciding which program gets CPU time on a multicore system.",
-                    "Process isolation that prevents one program from corrupting another's memory."
-                ]
-                keywords_list = ["process", "thread", "scheduling", "context switch"]
-                industry = "Cloud providers and OS vendors optimize scheduling for fairness and throughput."
-                summary = "OS components like schedulers and memory managers ensure programs run efficiently and safely."
-            elif any(k in dl for k in ["thread", "process vs", "difference"]):
-                examples = [
-                    "Web server uses multiple threads to handle concurrent client requests.",
-                    "Python's multiprocessing uses separate processes to bypass the Global Interpreter Lock."
-                ]
-                keywords_list = ["thread", "process", "lightweight", "shared memory", "concurrency"]
-                industry = "Concurrent applications choose threads or processes based on performance and isolation needs."
-                summary = "Threads share memory and are lightweight; processes are isolated and heavyweight."
-            elif any(k in dl for k in ["page", "replacement", "virtual"]):
-                examples = [
-                    "LRU page replacement evicts least-recently-used pages to manage memory.",
-                    "OS swaps pages to disk when physical memory fills up."
-                ]
-                keywords_list = ["page replacement", "virtual memory", "paging", "TLB", "page fault"]
-                industry = "Memory management is critical for OS efficiency, especially on embedded systems."
-                summary = "Paging enables abstract memory; replacement policies balance speed and space."
-            elif any(k in dl for k in ["ipc", "inter-process", "communication"]):
-                examples = [
-                    "Pipes in Unix shells pass data between processes.",
-                    "Message queues in microservices decouple service communication."
-                ]
-                keywords_list = ["IPC", "pipes", "sockets", "message queues", "shared memory"]
-                industry = "Distributed systems and microservices rely on robust inter-process communication."
-                summary = "IPC methods trade-off latency, simplicity, and flexibility based on needs."
-            elif any(k in dl for k in ["deadlock", "mutex", "semaphore"]):
-                examples = [
-                    "Two processes waiting on each other for locks (classic deadlock).",
-                    "Using semaphores to coordinate access to a limited pool of resources."
-                ]
-                keywords_list = ["deadlock", "resource allocation", "locking", "synchronization"]
-                industry = "Real-time systems and databases handle synchronization carefully to avoid deadlocks."
-                summary = "Avoid circular waits, use ordering or timeouts, and design for safe concurrent access."
-            else:
-                examples = [
-                    "Virtual memory enabling programs to use more memory than physically available.",
-                    "Device drivers letting OS interact with printers and network cards."
-                ]
-                keywords_list = ["virtual memory", "paging", "drivers", "kernel"]
-                industry = "System software, embedded devices, and cloud platforms rely on core OS services."
-
-        elif subject == "Database Management Systems":
-            definition = (
-                "Database Management Systems (DBMS) are software tools for storing, managing, and querying data efficiently."
-            )
-            if any(k in dl for k in ["acid", "acid properties"]):
-                examples = [
-                    "Banking systems use ACID to ensure money transfers are reliable.",
-                    "E-commerce platforms apply ACID to handle concurrent orders safely."
-                ]
-                keywords_list = ["atomicity", "consistency", "isolation", "durability"]
-                industry = "Financial institutions and mission-critical systems rely on ACID compliance."
-                summary = "ACID ensures reliable transactions; each part is crucial for data integrity."
-            elif any(k in dl for k in ["normalization", "normal form", "1nf", "2nf", "3nf"]):
-                examples = [
-                    "Organizing student data into separate tables for courses and records.",
-                    "Designing a library database without data redundancy."
-                ]
-                keywords_list = ["normalization", "decomposition", "functional dependency", "normal forms"]
-                industry = "Database designers use normalization to minimize storage and improve query efficiency."
-                summary = "Normalization eliminates redundancy and improves data quality."
-            elif any(k in dl for k in ["primary", "key", "unique", "constraint"]):
-                examples = [
-                    "Student ID is a primary key uniquely identifying each student record.",
-                    "Email addresses are often unique constraints in user tables."
-                ]
-                keywords_list = ["primary key", "foreign key", "unique constraint", "data integrity"]
-                industry = "Database schemas use primary keys to enforce data integrity and enable fast lookups."
-                summary = "Primary keys uniquely identify records; foreign keys link related tables."
-            elif any(k in dl for k in ["join", "inner", "left", "right", "outer"]):
-                examples = [
-                    "Joining students and courses tables to find which courses each student takes.",
-                    "LEFT JOIN to list all students and their enrollments if any."
-                ]
-                keywords_list = ["join", "inner join", "left join", "right join", "cross product"]
-                industry = "Complex queries in data analysis and reporting heavily rely on joins."
-                summary = "Joins combine data from multiple tables based on relationships."
-            elif any(k in dl for k in ["index", "indexing", "performance", "search"]):
-                examples = [
-                    "B-tree indexes on student IDs speed up lookups from seconds to milliseconds.",
-                    "Full-text indexes enable fast searching in large document collections."
-                ]
-                keywords_list = ["index", "B-tree", "search", "query optimization", "trade-off"]
-                industry = "Indexes are crucial for database performance; they must be carefully chosen."
-                summary = "Indexes speed up retrieval at the cost of slower insertions and updates."
-            elif any(k in dl for k in ["sql", "nosql"]):
-                examples = [
-                    "SQL for structured data like financial records; NoSQL for flexible documents.",
-                    "Choosing MongoDB for rapid development vs PostgreSQL for strict schemas."
-                ]
-                keywords_list = ["relational", "document", "scalability", "schema"]
-                industry = "Startups prefer NoSQL flexibility; enterprises often use SQL for consistency."
-                summary = "SQL excels at structured data; NoSQL at scalability and flexibility."
-            else:
-                examples = [
-                    "Designing schemas to minimize redundancy and extraction.",
-                    "Querying databases to extract insights from large datasets."
-                ]
-                keywords_list = ["database", "schema", "query", "efficiency"]
-                industry = "Every application that stores data relies on a well-designed database."
-
-        elif subject == "Web Development":
-            definition = (
-                "Web Development involves building applications that run in browsers and web servers using HTML, CSS, JavaScript, and backend frameworks."
-            )
-            if any(k in dl for k in ["frontend", "backend"]):
-                examples = [
-                    "Frontend handles UI and user interactions; backend processes and stores data.",
-                    "React for frontend, Node.js for backend in a full-stack application."
-                ]
-                keywords_list = ["frontend", "backend", "client-server", "full-stack"]
-                industry = "Web applications power e-commerce, social media, and SaaS platforms."
-                summary = "Frontend is what users see; backend is the logic that powers it."
-            elif any(k in dl for k in ["rest", "api", "restful"]):
-                examples = [
-                    "Twitter API exposes endpoints for tweets, users, and timelines.",
-                    "Google Maps API provides location services to third-party apps."
-                ]
-                keywords_list = ["REST", "endpoints", "HTTP methods", "stateless"]
-                industry = "RESTful APIs connect mobile apps, web services, and IoT devices."
-                summary = "REST is a standard way to build APIs using HTTP methods."
-            elif any(k in dl for k in ["cookie", "session", "stateful"]):
-                examples = [
-                    "Shopping cart items persist via session cookies until checkout.",
-                    "Login tokens stored in cookies enable persistent authentication."
-                ]
-                keywords_list = ["cookies", "sessions", "authentication", "tokens"]
-                industry = "E-commerce and SaaS rely on cookies/sessions to manage user state."
-                summary = "Cookies store client data; sessions store server-side user state."
-            elif any(k in dl for k in ["mvc", "mvvm", "architecture", "pattern"]):
-                examples = [
-                    "Model stores data, View displays it, Controller handles user input.",
-                    "MVVM separates UI logic from business logic for testability."
-                ]
-                keywords_list = ["MVC", "Model", "View", "Controller", "separation of concerns"]
-                industry = "MVC architecture structures large web applications for maintainability."
-                summary = "MVC separates concerns: data, presentation, and logic."
-            elif any(k in dl for k in ["cors", "cross-origin", "same-origin"]):
-                examples = [
-                    "Frontend on domain A accessing API on domain B requires CORS headers.",
-                    "Browsers enforce same-origin policy for security unless CORS allows it."
-                ]
-                keywords_list = ["CORS", "cross-origin", "same-origin policy", "headers"]
-                industry = "Modern web requires CORS for secure cross-domain communication."
-                summary = "CORS allows controlled access to resources from different origins."
-            elif any(k in dl for k in ["request", "response", "http"]):
-                examples = [
-                    "A browser sends a GET request to fetch a web page.",
-                    "A form submission sends a POST request with user data to the server."
-                ]
-                keywords_list = ["HTTP", "request", "response", "status codes"]
-                industry = "HTTP is the foundation of web communication."
-                summary = "HTTP request-response cycle enables all web transactions."
-            else:
-                examples = [
-                    "Building interactive user interfaces that respond to user input.",
-                    "Creating scalable backend services that serve millions of users."
-                ]
-                keywords_list = ["web", "browser", "server", "ui", "database"]
-                industry = "Web development powers the modern internet and digital transformation."
-
-        elif subject == "Artificial Intelligence":
-            definition = (
-                "Artificial Intelligence (AI) is the field of creating intelligent machines that can learn, reason, and make decisions."
-            )
-            if any(k in dl for k in ["machine learning", "ml"]):
-                examples = [
-                    "Spam detection in email learns from labeled spam and legitimate emails.",
-                    "Movie recommendations learn user preferences from viewing history."
-                ]
-                keywords_list = ["supervised", "unsupervised", "training", "model"]
-                industry = "ML powers fraud detection, recommendation systems, and predictive analytics."
-                summary = "Machine learning enables systems to improve without explicit programming."
-            elif any(k in dl for k in ["supervised", "unsupervised"]):
-                examples = [
-                    "Supervised: predicting house prices from historical sales data.",
-                    "Unsupervised: clustering customers by shopping behavior patterns."
-                ]
-                keywords_list = ["labeled data", "clustering", "classification", "regression"]
-                industry = "Supervised learning dominates engineering; unsupervised helps discover patterns."
-                summary = "Supervised learning uses labels; unsupervised discovers hidden patterns."
-            elif any(k in dl for k in ["overfitting", "underfitting", "generalization"]):
-                examples = [
-                    "Model scoring 99% on training data but only 60% on test data (overfitting).",
-                    "Model too simple, scoring 70% on both training and test data (underfitting)."
-                ]
-                keywords_list = ["overfitting", "underfitting", "regularization", "cross-validation"]
-                industry = "Managing overfitting/underfitting is crucial for production ML systems."
-                summary = "Balance model complexity: too simple (underfitting), too complex (overfitting)."
-            elif any(k in dl for k in ["cluster", "clustering", "k-means"]):
-                examples = [
-                    "Customer segmentation clustering groups similar shoppers for targeted marketing.",
-                    "Document clustering organizes research papers by topic similarities."
-                ]
-                keywords_list = ["clustering", "k-means", "similarity", "centroid", "unlabeled"]
-                industry = "Clustering discovers hidden customer segments and market opportunities."
-                summary = "Clustering groups similar data points without labels; use for exploration."
-            elif any(k in dl for k in ["activation", "relu", "sigmoid", "tanh"]):
-                examples = [
-                    "ReLU in hidden layers allows networks to learn non-linear relationships.",
-                    "Sigmoid in output layer constrains predictions to probability [0, 1]."
-                ]
-                keywords_list = ["activation function", "ReLU", "sigmoid", "non-linearity"]
-                industry = "Activation functions are critical for deep learning to work well."
-                summary = "Activation functions introduce non-linearity enabling neural networks to learn complex patterns."
-            elif any(k in dl for k in ["neural", "deep learning", "neural network"]):
-                examples = [
-                    "Deep learning powers image recognition in Google Photos.",
-                    "Neural networks enable voice assistants like Alexa to understand speech."
-                ]
-                keywords_list = ["neural network", "layers", "backpropagation", "activation functions"]
-                industry = "Deep learning dominates computer vision, NLP, and autonomous systems."
-                summary = "Neural networks with many layers enable learning complex patterns."
-            else:
-                examples = [
-                    "Natural language processing enabling chatbots to understand questions.",
-                    "Computer vision helping autonomous vehicles detect objects."
-                ]
-                keywords_list = ["AI", "learning", "intelligence", "automation"]
-                industry = "AI is transforming every industry from healthcare to finance to transportation."
-
-        elif subject == "Software Engineering":
-            definition = (
-                "Software Engineering is the systematic process of planning, designing, building, testing, and maintaining software systems."
-            )
-            if any(k in dl for k in ["sdlc", "phases", "lifecycle"]):
-                examples = [
-                    "Waterfall: planning -> design -> coding -> testing -> deployment.",
-                    "Agile: iterative sprints with continuous feedback and improvement."
-                ]
-                keywords_list = ["planning", "design", "implementation", "testing", "deployment"]
-                industry = "SDLC models guide software projects from inception to maintenance."
-                summary = "SDLC phases ensure systematic, organized software development."
-            elif any(k in dl for k in ["design pattern", "pattern"]):
-                examples = [
-                    "Singleton pattern ensures only one instance of a database connection.",
-                    "Factory pattern creates objects without specifying exact classes."
-                ]
-                keywords_list = ["design pattern", "reusable", "best practices", "architecture"]
-                industry = "Design patterns reduce complexity and improve code maintainability."
-                summary = "Design patterns are proven solutions to common engineering problems."
-            elif any(k in dl for k in ["version control", "git", "svn"]):
-                examples = [
-                    "Git enables teams to collaborate, tracking all code changes over time.",
-                    "Branches allow parallel development of features before merging."
-                ]
-                keywords_list = ["version control", "git", "commit", "branch", "merge"]
-                industry = "Version control is essential for multi-person software teams."
-                summary = "Version control tracks code history, enables collaboration and rollback."
-            elif any(k in dl for k in ["unit test", "testing", "test-driven"]):
-                examples = [
-                    "Unit tests verify individual functions work correctly.",
-                    "Test-driven development writes tests before implementation."
-                ]
-                keywords_list = ["unit test", "TDD", "assertion", "mock", "coverage"]
-                industry = "Testing ensures code quality and reduces production bugs."
-                summary = "Unit tests catch bugs early; test-driven development improves design."
-            elif any(k in dl for k in ["ci", "cd", "continuous"]):
-                examples = [
-                    "CI/CD pipelines automate building, testing, and deploying code on every commit.",
-                    "Jenkins orchestrates testing and deployment workflows."
-                ]
-                keywords_list = ["CI/CD", "continuous integration", "deployment", "pipeline"]
-                industry = "CI/CD enables rapid, reliable software delivery."
-                summary = "CI/CD automates testing and deployment for faster, safer releases."
-            elif any(k in dl for k in ["agile", "scrum"]):
-                examples = [
-                    "Sprints of 2 weeks with daily standups and regular demos.",
-                    "User stories and backlog prioritization for continuous delivery."
-                ]
-                keywords_list = ["agile", "scrum", "sprint", "backlog", "iteration"]
-                industry = "Agile dominates modern software development across tech companies."
-                summary = "Agile enables rapid feedback and continuous improvement."
-            else:
-                examples = [
-                    "Planning large projects with clear requirements and timelines.",
-                    "Testing and debugging software to ensure reliability."
-                ]
-                keywords_list = ["software", "engineering", "quality", "process"]
-                industry = "Software engineering practices separate hobby coding from professional development."
-
-        elif subject == "Compiler Design":
-            definition = (
-                "Compiler Design covers the theory and practice of translating source code into machine-executable instructions."
-            )
-            if any(k in dl for k in ["lexical", "tokenization", "token"]):
-                examples = [
-                    "Converting 'int x = 5;' into tokens: INT, IDENTIFIER, ASSIGN, NUMBER.",
-                    "Building a symbol table to track variable names and types."
-                ]
-                keywords_list = ["lexical analysis", "tokenization", "scanner", "lexeme"]
-                industry = "Lexical analysis is the first phase in every compiler."
-                summary = "Lexical analysis breaks source code into meaningful tokens."
-            elif any(k in dl for k in ["parser", "parsing", "syntax"]):
-                examples = [
-                    "Parser checks if statement is: 'if (condition) { body }'.",
-                    "Building a parse tree to represent code structure."
-                ]
-                keywords_list = ["parsing", "syntax", "grammar", "parse tree"]
-                industry = "Parsers enforce language syntax rules."
-                summary = "Parser analyzes token sequence to build syntactic structure."
-            elif any(k in dl for k in ["semantic", "type check", "scope"]):
-                examples = [
-                    "Type checker ensures 'int x = \"hello\";' is caught as an error.",
-                    "Scope checker ensures variables are declared before use."
-                ]
-                keywords_list = ["semantic analysis", "type checking", "scope", "symbol table"]
-                industry = "Semantic analysis prevents type errors and undefined variables."
-                summary = "Semantic analysis validates meaning; catches errors before code generation."
-            elif any(k in dl for k in ["symbol table", "symbol", "scope", "binding"]):
-                examples = [
-                    "Symbol table tracks variable name, type, scope, and memory address.",
-                    "Scope resolution: inner scope variable shadows outer scope variable."
-                ]
-                keywords_list = ["symbol table", "scope", "binding", "lookup", "resolution"]
-                industry = "Symbol tables are crucial for managing variable visibility and type information."
-                summary = "Symbol tables track variable metadata across scopes for type safety."
-            elif any(k in dl for k in ["intermediate", "representation", "ir", "ir code"]):
-                examples = [
-                    "IR: 'x = a + b' becomes: t1 = LOAD a; t2 = LOAD b; t3 = ADD t1, t2; STORE t3, x.",
-                    "IR enables platform-independent optimization before code generation."
-                ]
-                keywords_list = ["intermediate representation", "IR", "optimization", "portable"]
-                industry = "IR allows compilers to optimize code independently of target platform."
-                summary = "Intermediate representation bridges source code and machine code."
-            elif any(k in dl for k in ["code generation", "codegen"]):
-                examples = [
-                    "Translating 'x = a + b' into assembly: load a, add b, store x.",
-                    "Optimizing loops for faster execution."
-                ]
-                keywords_list = ["code generation", "assembly", "optimization", "machine code"]
-                industry = "Code generation determines final program performance."
-                summary = "Code generation translates optimized intermediate code to machine instructions."
-            else:
-                examples = [
-                    "Translating high-level language to machine instructions.",
-                    "Optimizing compiler output for speed and memory efficiency."
-                ]
-                keywords_list = ["compiler", "compilation", "translation", "optimization"]
-                industry = "Compilers are fundamental tools enabling all software development."
-
-        elif subject == "Discrete Mathematics":
-            definition = (
-                "Discrete Mathematics studies mathematical structures with distinct, separate values used in computer science."
-            )
-            if any(k in dl for k in ["set", "set theory", "operations"]):
-                examples = [
-                    "Set of all prime numbers: {2, 3, 5, 7, 11, ...}",
-                    "Union of students in CS: all students in all CS sections."
-                ]
-                keywords_list = ["set", "union", "intersection", "subset", "complement"]
-                industry = "Set theory foundations computer database design and logic."
-                summary = "Sets organize elements; operations like union process them."
-            elif any(k in dl for k in ["graph", "graph theory", "vertex", "edge"]):
-                examples = [
-                    "Social network: people are vertices, friendships are edges.",
-                    "City map: intersections are vertices, roads are edges."
-                ]
-                keywords_list = ["graph", "vertex", "edge", "path", "connected"]
-                industry = "Graph theory powers networking, recommendation engines, and routing."
-                summary = "Graphs model relationships; algorithms traverse or optimize them."
-            elif any(k in dl for k in ["boolean", "boolean algebra", "logic"]):
-                examples = [
-                    "Boolean expression: (A AND B) OR NOT(C) simplifies circuit logic.",
-                    "Truth table shows all possible inputs and outputs for a Boolean function."
-                ]
-                keywords_list = ["Boolean algebra", "AND", "OR", "NOT", "truth table"]
-                industry = "Boolean logic is the foundation of digital circuit and CPU design."
-                summary = "Boolean algebra simplifies logic; gates implement Boolean operations."
-            elif any(k in dl for k in ["logic gate", "gate", "circuit"]):
-                examples = [
-                    "AND gate: output 1 only if both inputs are 1.",
-                    "OR gate: output 1 if at least one input is 1."
-                ]
-                keywords_list = ["logic gate", "AND", "OR", "NOT", "NAND", "circuit"]
-                industry = "Logic gates are building blocks of all digital computers."
-                summary = "Logic gates implement Boolean operations; combined they form circuits."
-            elif any(k in dl for k in ["induction", "mathematical induction", "proof"]):
-                examples = [
-                    "Prove 1 + 2 + ... + n = n(n+1)/2 by induction over n.",
-                    "Base case: n=1 works. Inductive step: if true for n, prove for n+1."
-                ]
-                keywords_list = ["mathematical induction", "base case", "inductive step", "proof"]
-                industry = "Mathematical induction proves properties over infinite sequences."
-                summary = "Induction proves statements by establishing base case and inductive step."
-            elif any(k in dl for k in ["combinatorics", "probability", "permutation", "combination"]):
-                examples = [
-                    "Permutations: arranging 3 books in different orders.",
-                    "Probability: chance of drawing a specific card from a deck."
-                ]
-                keywords_list = ["combinatorics", "probability", "factorial", "expected value"]
-                industry = "Probability and combinatorics underpin cryptography and algorithms."
-                summary = "Combinatorics counts arrangements; probability measures uncertainty."
+    record = Answer(snap.knowledge.resolve(branch, subject, normalize_doubt(d)), branch, subject, d)
+    cached = (record, snap.fragments.render(record, fmt))
+    RESPONSE_CACHE.put(key, cached)
+    return cached
+
+
+def answer_in_context(snap, branch: str, subject: str, doubt: str, context=None, fmt: str = "html"):
+    """``(Answer, rendered, followed)`` like ``answer()``, except that a doubt which
+    reads as a follow-up ("another example?") is answered from ``context``, the
+    conversation's previous topic in the same subject.
+
+    The follow-up check comes first: ``is_follow_up`` only accepts short doubts
+    with no words of their own, and one of those can still hit a topic through
+    its example text. Only the doubt and the stored context are looked at;
+    nothing earlier in the conversation is classified again.
+    """
+    question = clip_doubt(doubt or "")
+    if context is not None and context[:2] == (branch, subject) and is_follow_up(normalize_doubt(question)):
+        key = (snap.version, context, question, fmt)
+        followed = RESPONSE_CACHE.get(key)
+        if followed is None:
+            previous = snap.knowledge.get(*context[2:])
+            if previous is not None:
+                follow_up = Answer(previous, branch, subject, question, follow_up=True)
+                followed = (follow_up, snap.fragments.render(follow_up, fmt))
             else:
-                examples = [
-                    "Logic and reasoning problems solved using discrete structures.",
-                    "Counting problems using combinatorics and permutations."
-                ]
-                keywords_list = ["discrete", "mathematics", "logic", "counting"]
-                industry = "Discrete math is essential for algorithm analysis and computer science."
-
-
-    # Nicely format the response with conditional sections
-    resp = [intro]
-    resp.append(f"<h3>Definition</h3><p>{definition}</p>")
-    if examples:
-        resp.append(f"<h3>Real-world Examples</h3>{make_list(examples)}")
-    if industry:
-        resp.append(f"<h3>Industry Application</h3><p>{industry}</p>")
-    if keywords_list:
-        resp.append(f"<h3>Important Keywords</h3>{make_list(keywords_list)}")
-    if summary:
-        resp.append(f"<h3>Short Summary</h3><p>{summary}</p>")
-
-    footer = (
-        "<p class=\"response-footer\">"
-        "Feel free to refine your question or ask for a concrete example; I'm happy to help further!"
-        "</p>"
+                followed = ()
+            RESPONSE_CACHE.put(key, followed)
+        if followed:
+            return followed + (True,)
+    record, rendered = answer(snap, branch, subject, doubt, fmt)
+    return record, rendered, False
+
+
+def _session():
+    """``(session id, context)`` for this request, or ``(None, None)`` without a live session."""
+    sid = request.cookies.get(SESSION_COOKIE)
+    if sid is None or len(sid) != SESSION_ID_CHARS:
+        return None, None
+    context = SESSIONS.get(sid)
+    return (sid, context) if context is not None else (None, None)
+
+
+def _remember(snap, page, sid, branch: str, subject: str, topic) -> None:
+    """Store ``topic`` (if any) as the conversation's context, starting a session if needed.
+
+    The cookie is sent again whenever the session is used: the server-side TTL
+    restarts on every use, so the cookie's lifetime has to restart with it.
+    """
+    if topic is not None and topic.matched and subject in snap.knowledge.branches.get(branch, ()):
+        if sid is None:
+            # ids are always minted here, never taken from the client
+            sid = secrets.token_urlsafe(16)
+        SESSIONS.put(sid, (branch, subject, topic.branch, topic.subject, topic.id))
+    _send_session(page, sid)
+
+
+def _send_session(response, sid) -> None:
+    if sid is not None:
+        response.set_cookie(SESSION_COOKIE, sid, max_age=int(SESSIONS.ttl), httponly=True, samesite='Lax')
+
+
+def record_topic(topic) -> None:
+    """Count a served answer. Labels come from the knowledge base, never from user input."""
+    TOPIC_HITS.inc(topic.branch, topic.subject, topic.id)
+    CLASSIFICATIONS.inc(topic.subject, topic.outcome)
+
+
+def solve_item(snap, item, include_html: bool = False, topics=None) -> dict:
+    """Classify one ``{branch, subject, doubt}`` dict against snapshot ``snap``.
+
+    ``topics`` is an optional per-batch memo of (branch, subject, normalized doubt)
+    to its classification. ``candidates`` lists the runner-up topics with their
+    BM25 scores; ``detected`` is set when another subject answered the doubt.
+    Raises ``ValueError`` for malformed items.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("expected an object")
+    branch = item.get("branch", DEFAULT_BRANCH)
+    subject = item.get("subject", DEFAULT_SUBJECT)
+    doubt = item.get("doubt", "")
+    if not all(isinstance(v, str) for v in (branch, subject, doubt)):
+        raise ValueError("branch, subject and doubt must be strings")
+
+    d = clip_doubt(doubt)
+    key = (branch, subject, normalize_doubt(d))
+    classified = topics.get(key) if topics is not None else None
+    if classified is None:
+        classified = snap.knowledge.classify(*key)
+        if topics is not None:
+            topics[key] = classified
+    topic, ranked, confidence = classified
+    record_topic(topic)
+
+    result = {
+        "branch": branch,
+        "subject": subject,
+        "topic": topic.id,
+        "matched": topic.matched,
+        "score": round(ranked[0][1], 4) if ranked else 0.0,
+        "candidates": [{"topic": t.id, "score": round(s, 4)} for t, s in ranked[1:]],
+        "sections": snap.fragments.sections(topic),
+    }
+    if confidence is not None:
+        result["detected"] = {"branch": topic.branch, "subject": topic.subject, "confidence": round(confidence, 4)}
+    if include_html:
+        result["html"] = snap.fragments.render(Answer(topic, branch, subject, d), "html")
+    return result
+
+
+def solve_batch(items, include_html: bool = False) -> list:
+    """Classify a list of ``{branch, subject, doubt}`` dicts in one pass.
+
+    Each distinct (branch, subject, normalized doubt) is classified once per batch,
+    and results reuse the pre-rendered sections, so an item costs a dict lookup
+    plus at most one scoring pass. The whole batch is answered from one snapshot.
+    Raises ``ValueError`` for malformed items.
+    """
+    snap = SNAPSHOTS.current
+    topics = {}
+    results = []
+    for i, item in enumerate(items):
+        try:
+            results.append(solve_item(snap, item, include_html, topics))
+        except ValueError as exc:
+            raise ValueError(f"item {i}: {exc}") from None
+    return results
+
+
+def iter_solutions(items, include_html: bool = False):
+    """Lazily solve an iterable of items, yielding one result dict per item.
+
+    Nothing is retained between items, so memory stays flat however long ``items``
+    is. Malformed items yield ``{"index": i, "error": ...}`` instead of stopping
+    the stream, since the response status has already been sent. Every record
+    carries ``elapsed_ms`` since the stream started. The snapshot is taken once,
+    so a reload mid-stream does not mix answers from two versions.
+    """
+    snap = SNAPSHOTS.current
+    start = time.perf_counter()
+    for i, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            record = solve_item(snap, item, include_html)
+        except ValueError as exc:
+            record = {"error": str(exc)}
+        record["index"] = i
+        record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        yield record
+
+
+def _iter_ndjson(stream, max_line: int):
+    """Yield one parsed object per line of ``stream``, or a ``ValueError`` for a bad line."""
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            return
+        if len(line) > max_line:
+            # discard the rest of the oversized line before reporting it
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_line + 1)
+            yield ValueError(f"line exceeds {max_line} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield ValueError("line is not valid JSON")
+
+
+@bp.route('/api/solve', methods=['POST'])
+def api_solve():
+    """Solve a JSON array of doubts; add ``?html=1`` to include rendered answers."""
+    # read at most one byte past the limit so chunked bodies are bounded too
+    raw = request.stream.read(MAX_BATCH_BYTES + 1)
+    if len(raw) > MAX_BATCH_BYTES:
+        return jsonify(error=f"payload exceeds {MAX_BATCH_BYTES} bytes"), 413
+    try:
+        items = json.loads(raw)
+    except ValueError:
+        return jsonify(error="body must be a JSON array"), 400
+    if not isinstance(items, list):
+        return jsonify(error="body must be a JSON array"), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify(error=f"batch exceeds {MAX_BATCH_ITEMS} items"), 413
+
+    include_html = request.args.get('html', '').lower() in ('1', 'true', 'yes')
+    try:
+        results = solve_batch(items, include_html)
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+    return jsonify(count=len(results), results=results)
+
+
+@bp.route('/api/suggest')
+def api_suggest():
+    """Completions for the doubt box from the sample doubts and trigger keywords;
+    ``?q=`` is what has been typed so far."""
+    suggestions = SNAPSHOTS.current.knowledge.suggest(request.args.get('q', ''), SUGGEST_LIMIT)
+    response = jsonify(suggestions=suggestions)
+    # the same prefix is typed by many students; let browsers and proxies reuse the answer
+    response.cache_control.public = True
+    response.cache_control.max_age = SUGGEST_MAX_AGE
+    return response
+
+
+@bp.route('/api/solve/stream', methods=['POST'])
+def api_solve_stream():
+    """Stream answers for an NDJSON body of doubts, one result per input line.
+
+    Results go out as NDJSON, or as Server-Sent Events when the client accepts
+    ``text/event-stream``. Input is read line by line while answering, so neither
+    side of the batch is held in memory. A final record/``done`` event reports the
+    item count, errors, time to first result and total time.
+    """
+    include_html = request.args.get('html', '').lower() in ('1', 'true', 'yes')
+    use_sse = request.accept_mimetypes.best_match(
+        ['application/x-ndjson', 'text/event-stream']
+    ) == 'text/event-stream'
+
+    def generate():
+        count = errors = 0
+        first_ms = None
+        for record in iter_solutions(_iter_ndjson(request.stream, MAX_STREAM_LINE_BYTES), include_html):
+            count += 1
+            errors += "error" in record
+            if first_ms is None:
+                first_ms = record["elapsed_ms"]
+            payload = json.dumps(record)
+            yield f"event: result\ndata: {payload}\n\n" if use_sse else payload + "\n"
+            last_ms = record["elapsed_ms"]
+        done = {"done": True, "count": count, "errors": errors,
+                "first_result_ms": first_ms, "elapsed_ms": last_ms if count else 0.0}
+        payload = json.dumps(done)
+        yield f"event: done\ndata: {payload}\n\n" if use_sse else payload + "\n"
+
+    response = current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
+    )
+    # ask reverse proxies not to buffer, so results reach the client as they are produced
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@bp.before_app_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@bp.after_app_request
+def _observe_request(response):
+    start = g.get('request_start')
+    if start is not None:
+        now = time.perf_counter()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(now - start, route, request.method)
+        if STARTUP['time_to_first_request_ms'] is None:
+            _first_request(start, now)
+    return response
+
+
+def _first_request(start: float, end: float) -> None:
+    with _startup_lock:
+        if STARTUP['time_to_first_request_ms'] is not None:
+            return
+        STARTUP['first_request_ms'] = round((end - start) * 1000, 2)
+        STARTUP['time_to_first_request_ms'] = round((end - _startup_origin) * 1000, 2)
+    log.info(
+        "pid %d startup: import %s ms, create_app %s ms, ready %s ms, first request %s ms (%s ms from start)",
+        STARTUP['pid'], STARTUP['import_ms'], STARTUP['create_app_ms'], STARTUP['ready_ms'],
+        STARTUP['first_request_ms'], STARTUP['time_to_first_request_ms'],
     )
-    resp.append(footer)
 
-    return "\n".join(resp)
+
+@bp.after_app_request
+def _compress(response):
+    return compress_response(request, response)
+
+
+@bp.app_context_processor
+def _asset_helpers():
+    return {'asset_url': asset_url}
+
+
+def asset_url(name: str) -> str:
+    """URL of a static file under its content-hashed name, e.g. ``/assets/style.<hash>.css``."""
+    return url_for('solver.asset', filename=STATIC_ASSETS[name].hashed_name)
+
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    found = ASSETS_BY_HASH.get(filename)
+    if found is None:
+        # stale or unhashed name: point at the current version if the file exists
+        stem, _, ext = filename.rpartition('.')
+        base = f"{stem.rpartition('.')[0] or stem}.{ext}"
+        if base in STATIC_ASSETS:
+            return redirect(asset_url(base))
+        abort(404)
+    return found.respond(request, current_app.response_class)
+
+
+def page_etag(snap, branch: str, subject: str, doubt: str, encoding: str, context=None, fmt: str = 'html') -> str:
+    """Strong ETag for GET ``/``, computed from its inputs so a match skips all work.
+
+    ``context`` is the session's previous topic, which a follow-up doubt is answered
+    from; ``fmt`` is the negotiated answer format.
+    """
+    key = "\0".join((snap.page_version, branch, subject, doubt.strip(), encoding, fmt) + (context or ()))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    return current_app.response_class(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@bp.route('/healthz')
+def healthz():
+    """Liveness: the process is up and answering requests."""
+    return jsonify(status='ok')
+
+
+@bp.route('/readyz')
+def readyz():
+    """Readiness: the knowledge snapshot is loaded and this worker has started."""
+    snap = SNAPSHOTS.current
+    body = {
+        'ready': READY, 'pid': os.getpid(), 'version': snap.version, 'generation': snap.generation,
+        'startup': STARTUP,
+    }
+    return jsonify(body), 200 if READY else 503
+
+
+@bp.route('/api/knowledge')
+def knowledge_info():
+    """Version, generation and build time of the serving snapshot, plus reload counters."""
+    info = SNAPSHOTS.current.info()
+    info.update(reloads=SNAPSHOTS.reloads, reload_failures=SNAPSHOTS.failures)
+    return jsonify(info)
+
+
+@bp.route('/catalog.<fingerprint>.json')
+def catalog(fingerprint):
+    current = SNAPSHOTS.current.catalog
+    if fingerprint != current.fingerprint:
+        # a page rendered before the catalog changed; send it to the current version
+        return redirect(url_for('solver.catalog', fingerprint=current.fingerprint))
+    return current.respond(request, current_app.response_class)
+
+
+def admission_controlled(view):
+    """Run ``view`` only if the client is within its rate limit and a slot is free.
+
+    Over the limit the client gets 429, and a full queue gets 503, both with
+    Retry-After and before any of the request body is read.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if RATE_LIMITER is not None:
+            # behind a proxy, wrap the app in werkzeug's ProxyFix so this is the real client
+            wait = RATE_LIMITER.take(request.remote_addr)
+            if wait:
+                ADMISSIONS.inc('rate_limited')
+                raise TooManyRequests(retry_after=math.ceil(wait))
+        if ANSWER_GATE is None:
+            ADMISSIONS.inc('admitted')
+            return view(*args, **kwargs)
+        outcome = ANSWER_GATE.acquire()
+        if outcome is None:
+            ADMISSIONS.inc('overloaded')
+            raise ServiceUnavailable(retry_after=1)
+        ADMISSIONS.inc(outcome)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            ANSWER_GATE.release()
+    return wrapper
 
 
-@app.route('/', methods=['GET', 'POST'])
+@bp.route('/', methods=['GET', 'POST'])
+@admission_controlled
 def index():
+    """The page. POST answers the submitted form; GET may carry the same fields as
+    query parameters, which makes answers linkable and lets GETs be revalidated
+    with If-None-Match without classifying or rendering anything.
+
+    A client whose Accept header prefers JSON, Markdown or plain text over HTML
+    gets only the answer, in that format, instead of the page.
+    """
     response = ""
-    selected_branch = "Computer Science"
-    selected_subject = "Data Structures"
+    media_type = request.accept_mimetypes.best_match(FORMATS, default='text/html')
+    fmt = FORMATS[media_type]
+    snap = SNAPSHOTS.current
+    params = _form_params()
+    selected_branch = params.get('branch', DEFAULT_BRANCH)
+    selected_subject = params.get('subject', DEFAULT_SUBJECT)
+    doubt = params.get('doubt', '')
+    sid, context = _session()
 
-    if request.method == 'POST':
-        selected_branch = request.form.get('branch', 'Computer Science')
-        selected_subject = request.form.get('subject', 'Data Structures')
-        doubt = request.form.get('doubt', '')
-        response = get_response(selected_branch, selected_subject, doubt)
-
-    return render_template(
-        'index.html',
-        response=response,
-        branch=selected_branch,
-        subject=selected_subject,
-        branch_subjects=BRANCH_SUBJECTS,
-        sample_doubts=SAMPLE_DOUBTS,
+    etag = None
+    if request.method == 'GET':
+        etag = page_etag(snap, selected_branch, selected_subject, doubt, negotiate(request), context, fmt)
+        if request.if_none_match.contains(etag):
+            not_modified = make_response('', 304)
+            not_modified.set_etag(etag)
+            _send_session(not_modified, sid)
+            not_modified.vary.update(('Accept', 'Accept-Encoding', 'Cookie'))
+            return not_modified
+
+    topic = None
+    if request.method == 'POST' or doubt.strip() or fmt != 'html':
+        topic, response = _answer_request(snap, selected_branch, selected_subject, doubt, context, fmt)
+
+    if fmt == 'json':
+        page = jsonify(response)
+    elif fmt != 'html':
+        page = current_app.response_class(response, content_type=f'{media_type}; charset=utf-8')
+    else:
+        start = time.perf_counter()
+        page = make_response(render_template(
+            'index.html',
+            response=response,
+            branch=selected_branch,
+            subject=selected_subject,
+            branches=snap.knowledge.branches.keys(),
+            subjects=snap.knowledge.branches.get(selected_branch, ()),
+            catalog_url=url_for('solver.catalog', fingerprint=snap.catalog.fingerprint),
+        ))
+        PHASE_SECONDS.observe(time.perf_counter() - start, 'render')
+
+    _remember(snap, page, sid, selected_branch, selected_subject, topic)
+    page.vary.update(('Accept', 'Cookie'))
+    if etag is not None:
+        page.set_etag(etag)
+        # always revalidate; unchanged pages cost a 304 and no rendering
+        page.cache_control.no_cache = True
+    return page
+
+
+@bp.route('/answer', methods=['POST'])
+@admission_controlled
+def answer_fragment():
+    """Only the answer card's HTML for the submitted form.
+
+    The page's script posts the form here and swaps the result into the card, so
+    a question costs one small response instead of a whole page. Answers,
+    follow-ups, sessions and logging work exactly as for POST ``/``.
+    """
+    snap = SNAPSHOTS.current
+    params = _form_params()
+    selected_branch = params.get('branch', DEFAULT_BRANCH)
+    selected_subject = params.get('subject', DEFAULT_SUBJECT)
+    sid, context = _session()
+    topic, response = _answer_request(
+        snap, selected_branch, selected_subject, params.get('doubt', ''), context, 'html',
     )
+    fragment = current_app.response_class(response, content_type='text/html; charset=utf-8')
+    _remember(snap, fragment, sid, selected_branch, selected_subject, topic)
+    return fragment
+
+
+def _form_params():
+    """The submitted fields: the form of a POST, the query parameters of a GET.
+
+    Larger bodies get 413 before any of them is parsed, longer query strings 414.
+    The length is checked here rather than through ``request.max_content_length``,
+    which can only be set per request from Flask 3.1 on; a chunked body, whose
+    length is unknown up front, gets 411.
+    """
+    if request.method == 'POST':
+        length = request.content_length
+        if length is None and 'chunked' in request.headers.get('Transfer-Encoding', '').lower():
+            raise LengthRequired()
+        if length is not None and length > MAX_FORM_BYTES:
+            raise RequestEntityTooLarge()
+        return request.form
+    if len(request.query_string) > MAX_FORM_BYTES:
+        raise RequestURITooLarge()
+    return request.args
+
+
+def _answer_request(snap, branch: str, subject: str, doubt: str, context, fmt: str):
+    """``(topic, rendered)`` for a doubt submitted to ``/`` or ``/answer``, counted in
+    the metrics and the query log."""
+    start = time.perf_counter()
+    record, response, followed = answer_in_context(snap, branch, subject, doubt, context, fmt)
+    elapsed = time.perf_counter() - start
+    record_topic(record.topic)
+    if followed:
+        FOLLOW_UPS.inc()
+    if QUERY_LOG is not None:
+        QUERY_LOG.record(branch, subject, doubt, record.topic, elapsed)
+    PHASE_SECONDS.observe(elapsed, 'classify')
+    return record.topic, response
+
+
+def _warm(snap) -> None:
+    """Answer every sample doubt once, filling the subject, fragment and response caches."""
+    for (branch, subject), samples in snap.knowledge.samples.items():
+        for doubt in samples:
+            answer(snap, branch, subject, doubt)
+    # startup traffic is not real traffic
+    RESPONSE_CACHE.reset_stats()
+
+
+def create_app(config=None, prefork: bool = False) -> Flask:
+    """Build the Flask app, and on the first call the process-wide state it serves.
+
+    ``config`` overrides ``DEFAULT_CONFIG`` and the environment. With ``prefork``
+    (set by gunicorn.conf.py) the app is being preloaded in a master process:
+    the shared state is frozen for the collector, no threads are started, and
+    start_worker() runs in each worker after fork. Otherwise the app starts
+    serving from this process straight away.
+    """
+    global STATIC_ASSETS, ASSETS_BY_HASH, SNAPSHOTS, RELOAD_INTERVAL, RATE_LIMITER, ANSWER_GATE, SESSIONS, QUERY_LOG
+
+    started = time.perf_counter()
+    app = Flask(__name__)
+    for key, default in DEFAULT_CONFIG.items():
+        value = os.environ.get(key)
+        if value is None:
+            app.config[key] = default
+        elif isinstance(default, bool):
+            app.config[key] = value.lower() in ('1', 'true', 'yes')
+        else:
+            app.config[key] = type(default)(value)
+    app.config.update(config or {})
+    app.register_blueprint(bp)
+
+    if SNAPSHOTS is None:
+        STATIC_ASSETS = load_static_assets(os.path.join(ROOT, 'static'))
+        ASSETS_BY_HASH = {asset.hashed_name: asset for asset in STATIC_ASSETS.values()}
+        SNAPSHOTS = SnapshotHolder(
+            page_salt=_static_page_salt(),
+            build_dir=app.config['KNOWLEDGE_BUILD_DIR'],
+            resident=app.config['KNOWLEDGE_RESIDENT_SUBJECTS'],
+        )
+        RELOAD_INTERVAL = app.config['KNOWLEDGE_RELOAD_INTERVAL']
+        SESSIONS = TTLCache(app.config['SESSION_MAX_ENTRIES'], app.config['SESSION_TTL'])
+        if app.config['QUERY_LOG']:
+            QUERY_LOG = QueryLog(app.config['QUERY_LOG'], text=app.config['QUERY_LOG_TEXT'])
+        if app.config['RATE_LIMIT_PER_SECOND'] > 0:
+            RATE_LIMITER = TokenBuckets(app.config['RATE_LIMIT_PER_SECOND'], app.config['RATE_LIMIT_BURST'])
+        if app.config['MAX_CONCURRENT_ANSWERS'] > 0:
+            ANSWER_GATE = ConcurrencyGate(
+                app.config['MAX_CONCURRENT_ANSWERS'], app.config['ADMISSION_QUEUE'],
+                app.config['ADMISSION_QUEUE_TIMEOUT'],
+            )
+        if app.config['WARM_CACHES']:
+            _warm(SNAPSHOTS.current)
+        STARTUP['create_app_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    if prefork:
+        # Everything built so far lives as long as the workers. Moving it to the
+        # permanent generation stops their collectors from touching (and so
+        # copying) the pages they share with the master.
+        gc.freeze()
+    else:
+        start_worker()
+    return app
+
+
+def mark_fork() -> None:
+    """Start a forked worker's startup timeline; call it right after the fork
+    (gunicorn's ``post_fork``). Everything before was the master's."""
+    global _startup_origin
+    STARTUP['pid'] = os.getpid()
+    _startup_origin = time.perf_counter()
+
+
+def start_worker() -> None:
+    """Start the per-process background work and mark this process ready.
+
+    Threads do not survive fork, so under a pre-fork server this runs in each
+    worker (gunicorn's ``post_worker_init``), not in the master.
+    """
+    global READY
+    if SNAPSHOTS is None:
+        raise RuntimeError("create_app() must run before start_worker()")
+    if STARTUP['pid'] != os.getpid():
+        # forked by a server that did not call mark_fork(): count from here instead
+        mark_fork()
+    if RELOAD_INTERVAL > 0:
+        SNAPSHOTS.watch(RELOAD_INTERVAL)
+    if QUERY_LOG is not None:
+        QUERY_LOG.start()
+        # write out what is still buffered when the process exits
+        atexit.register(QUERY_LOG.stop)
+    READY = True
+    STARTUP['ready_ms'] = round((time.perf_counter() - _startup_origin) * 1000, 2)
+
 
+STARTUP['import_ms'] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 2)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
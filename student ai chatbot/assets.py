@@ -0,0 +1,147 @@
+"""Fingerprinted, immutable assets and response compression.
+
+An asset's URL embeds a hash of its bytes, so browsers and proxies can cache it
+for a year: when the content changes, the page simply points at a new URL.
+Assets are compressed once at startup (gzip, plus brotli when the optional
+``brotli`` package is installed); dynamic responses are compressed per request
+with the same content negotiation.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# One year; safe because the URL changes whenever the bytes do
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+# Above this size brotli's best quality costs seconds for a few percent, so
+# static assets fall back to quality 9
+MAX_BEST_COMPRESS_BYTES = 256 * 1024
+
+COMPRESSIBLE_TYPES = frozenset({
+    "text/html", "text/css", "text/plain", "text/markdown", "application/json", "application/javascript",
+    "image/svg+xml",
+})
+
+# Preference order when the client accepts several encodings
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(body: bytes, encoding: str, static: bool = False) -> bytes:
+    """Compress ``body``; ``static`` trades CPU for size since it happens once."""
+    if encoding == "br":
+        if static:
+            return brotli.compress(body, quality=11 if len(body) <= MAX_BEST_COMPRESS_BYTES else 9)
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9 if static else 6, mtime=0)
+    raise ValueError(f"unsupported encoding {encoding!r}")
+
+
+def negotiate(request, available=ENCODINGS) -> str:
+    """Pick the preferred encoding from ``available`` that the client accepts."""
+    accepted = request.accept_encodings
+    for encoding in available:
+        if accepted[encoding]:
+            return encoding
+    return "identity"
+
+
+class Asset:
+    """Pre-encoded bytes plus the fingerprint used in their URL and ETag."""
+
+    __slots__ = ("name", "fingerprint", "content_type", "encodings")
+
+    def __init__(self, name: str, body: bytes, content_type: str):
+        self.name = name
+        self.fingerprint = hashlib.sha256(body).hexdigest()[:16]
+        self.content_type = content_type
+        self.encodings = {"identity": body}
+        if content_type.split(";")[0] in COMPRESSIBLE_TYPES and len(body) >= MIN_COMPRESS_BYTES:
+            for encoding in ENCODINGS:
+                packed = compress(body, encoding, static=True)
+                if len(packed) < len(body):
+                    self.encodings[encoding] = packed
+
+    @property
+    def body(self) -> bytes:
+        return self.encodings["identity"]
+
+    @property
+    def hashed_name(self) -> str:
+        """``style.css`` -> ``style.<fingerprint>.css``"""
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.fingerprint}{ext}"
+
+    def respond(self, request, response_class):
+        """Serve the best pre-compressed variant with immutable caching and a strong ETag."""
+        encoding = negotiate(request, tuple(self.encodings))
+        response = response_class(self.encodings[encoding], content_type=self.content_type)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        if len(self.encodings) > 1:
+            response.vary.add("Accept-Encoding")
+        # each encoding is a different representation, so it needs its own strong ETag
+        response.set_etag(self.fingerprint if encoding == "identity" else f"{self.fingerprint}-{encoding}")
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+
+
+def catalog_asset(kb) -> Asset:
+    """Serialize the branch/subject catalog and sample doubts once, for the page script."""
+    catalog = {"branch_subjects": kb.branch_subjects, "sample_doubts": kb.sample_doubts}
+    body = json.dumps(catalog, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return Asset("catalog.json", body, "application/json")
+
+
+def load_static_assets(directory: str) -> dict:
+    """Read every file under ``directory`` into an ``Asset``, keyed by its relative path."""
+    assets = {}
+    for root, _, files in os.walk(directory):
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, directory).replace(os.sep, "/")
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES:
+                content_type += "; charset=utf-8"
+            with open(path, "rb") as fh:
+                assets[name] = Asset(name, fh.read(), content_type)
+    return assets
+
+
+def compress_response(request, response):
+    """Compress a finished dynamic response in place when it is worth it.
+
+    Streamed responses, already-encoded bodies, small bodies and types that do
+    not compress well are left alone.
+    """
+    if (
+        response.status_code != 200
+        or response.is_streamed
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(request)
+    if encoding == "identity":
+        return response
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
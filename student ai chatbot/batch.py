@@ -0,0 +1,180 @@
+"""Answer a whole file of doubts offline, on every core.
+
+    python batch.py questions.csv -o answers.jsonl
+    python batch.py doubts.jsonl --processes 8 --html > answers.jsonl
+
+Input is CSV with ``branch``, ``subject`` and ``doubt`` columns, or JSON lines
+of ``{"branch", "subject", "doubt"}`` objects (missing branch/subject take the
+``--branch``/``--subject`` defaults). It is read lazily and fanned out to a
+process pool in chunks. Each output line is the ``/api/solve`` result for the
+matching input line, plus its ``index``, written in input order. At most
+``--in-flight`` items are read ahead of the output, so memory stays flat for
+inputs of any length. Progress and throughput go to stderr.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import app
+from knowledge import KNOWLEDGE_DIR
+from shards import SHARD_DIR
+from snapshot import build_snapshot
+
+# Items handed to a worker per dispatch
+CHUNK_SIZE = 64
+
+# Per-worker memo of classifications, cleared when it grows past this
+MEMO_SIZE = 65536
+
+# Per-process state, set by _init_worker
+_SNAP = None
+_HTML = False
+_TOPICS = {}
+
+
+def read_items(path: str, fmt: str, branch: str, subject: str):
+    """Yield one item per input record, or a ``ValueError`` for a malformed one."""
+    fh = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        if fmt == "csv":
+            for row in csv.DictReader(fh):
+                yield {
+                    "branch": row.get("branch") or branch,
+                    "subject": row.get("subject") or subject,
+                    "doubt": row.get("doubt") or "",
+                }
+            return
+        for line in fh:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield ValueError("line is not valid JSON")
+                continue
+            if isinstance(item, dict):
+                item.setdefault("branch", branch)
+                item.setdefault("subject", subject)
+            yield item
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+
+def _init_worker(directory: str, build_dir: str, html: bool) -> None:
+    global _SNAP, _HTML
+    # the compiled build already exists (the parent opened it), so this only maps it
+    _SNAP = build_snapshot(directory, build_dir=build_dir)
+    _HTML = html
+
+
+def _solve(numbered) -> str:
+    index, item = numbered
+    if len(_TOPICS) > MEMO_SIZE:
+        _TOPICS.clear()
+    try:
+        if isinstance(item, ValueError):
+            raise item
+        result = app.solve_item(_SNAP, item, _HTML, _TOPICS)
+    except ValueError as exc:
+        result = {"error": str(exc)}
+    result["index"] = index
+    return json.dumps(result, ensure_ascii=False)
+
+
+def _throttled(items, slots: threading.Semaphore, stop: threading.Event):
+    # Pool.imap reads its input from a feeder thread as fast as it can; making
+    # that thread wait for a free slot bounds how far it runs ahead of the output
+    for numbered in enumerate(items):
+        slots.acquire()
+        if stop.is_set():
+            return
+        yield numbered
+
+
+def run(items, out, processes: int, chunksize: int, in_flight: int, init_args, progress=None) -> dict:
+    """Solve ``items`` on ``processes`` workers, writing JSON lines to ``out`` in input order."""
+    slots = threading.Semaphore(in_flight)
+    stop = threading.Event()
+    count = errors = 0
+    start = last_report = time.perf_counter()
+    with multiprocessing.Pool(processes, _init_worker, init_args) as pool:
+        try:
+            for line in pool.imap(_solve, _throttled(items, slots, stop), chunksize):
+                slots.release()
+                out.write(line)
+                out.write("\n")
+                count += 1
+                errors += line.startswith('{"error"')
+                now = time.perf_counter()
+                if progress is not None and now - last_report >= 1.0:
+                    progress(count, now - start)
+                    last_report = now
+        finally:
+            # let a feeder thread blocked on a slot finish, or the pool cannot shut down
+            stop.set()
+            slots.release(in_flight)
+    elapsed = time.perf_counter() - start
+    return {
+        "items": count,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "per_second": round(count / elapsed, 1) if elapsed else 0.0,
+        "processes": processes,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Answer a CSV or JSONL file of doubts with a process pool.")
+    parser.add_argument("input", help="CSV or JSONL file of doubts, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results (default: stdout)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from the file name)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help="items per dispatch to a worker")
+    parser.add_argument("--in-flight", type=int, help="items read ahead of the output (default: 8 chunks per worker)")
+    parser.add_argument("--html", action="store_true", help="include the rendered HTML answer")
+    parser.add_argument("--branch", default=app.DEFAULT_BRANCH, help="branch for items without one")
+    parser.add_argument("--subject", default=app.DEFAULT_SUBJECT, help="subject for items without one")
+    parser.add_argument("--knowledge", default=KNOWLEDGE_DIR, help="directory with the JSON sources")
+    parser.add_argument("--build-dir", default=SHARD_DIR, help="directory of compiled knowledge builds")
+    parser.add_argument("--quiet", action="store_true", help="no progress on stderr")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    in_flight = args.in_flight or args.chunksize * args.processes * 8
+    # compile (or validate) the build once here, before the workers open it
+    build_snapshot(args.knowledge, build_dir=args.build_dir)
+
+    def progress(count, seconds):
+        print(f"\r{count} doubts, {count / seconds:,.0f}/s", end="", file=sys.stderr, flush=True)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        summary = run(
+            read_items(args.input, fmt, args.branch, args.subject), out, args.processes, args.chunksize,
+            in_flight, (args.knowledge, args.build_dir, args.html), None if args.quiet else progress,
+        )
+    except BrokenPipeError:
+        # the reader went away (e.g. piped into head); stop without a second error at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if not args.quiet:
+        print(
+            f"\r{summary['items']} doubts ({summary['errors']} errors) in {summary['seconds']} s, "
+            f"{summary['per_second']:,.0f}/s on {summary['processes']} processes",
+            file=sys.stderr,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""Benchmark and sanity-check the doubt-solving hot path.
+
+Replays every ``SAMPLE_DOUBTS`` entry and synthetic corpora of several sizes and
+doubt lengths through ``get_response`` directly and through the ``/`` route via
+Flask's test client. Reports throughput, p50/p95/p99 latency and allocated bytes
+per call, and writes everything to JSON so runs can be compared:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+
+Every sample doubt must also resolve to its topic in ``EXPECTED_TOPICS``, every
+``ROUTED_DOUBTS`` entry (doubts asked in some other subject) to its expected
+subject and topic, and every ``CONVERSATIONS`` turn to its topic; a misrouted
+one is reported and makes the run exit non-zero (``--check`` runs only that
+check).
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import app
+from knowledge import normalize_doubt
+
+# Cold caches, no watcher thread competing with the measurements, and no rate
+# limit (every call comes from the same client)
+FLASK_APP = app.create_app({"KNOWLEDGE_RELOAD_INTERVAL": 0, "WARM_CACHES": False, "RATE_LIMIT_PER_SECOND": 0})
+
+BRANCH = app.DEFAULT_BRANCH
+
+# How many calls per case are re-run under tracemalloc (it is slow)
+ALLOC_SAMPLES = 200
+
+
+# Topic each sample doubt must resolve to, within its own subject. A sample the
+# subject has no specific topic for is expected to get the overview.
+EXPECTED_TOPICS = {
+    # Data Structures
+    'How does a binary search tree work?': 'trees',
+    'When should I use a hash table vs array?': 'hash-tables',
+    'Explain tree traversal methods': 'trees',
+    'What is the difference between stack and queue?': 'stacks-queues',
+    'How does a linked list work?': 'linked-lists',
+    'What are heaps and priority queues?': 'heaps',
+    # Operating Systems
+    'What is context switching?': 'processes',
+    'How do semaphores prevent race conditions?': 'synchronization',
+    'Explain virtual memory briefly': 'paging',
+    'What is a process vs thread?': 'threads',
+    'How does page replacement work?': 'paging',
+    'What is inter-process communication?': 'ipc',
+    # Algorithms
+    "What's the difference between merge sort and quick sort?": 'sorting',
+    'Explain dynamic programming with an example': 'dynamic-programming',
+    'When to use greedy algorithms?': 'overview',
+    'What is binary search and how is it different from linear search?': 'binary-search',
+    'Explain the divide and conquer approach': 'divide-and-conquer',
+    'What is backtracking with examples?': 'backtracking',
+    # Computer Networks
+    'What is the difference between TCP and UDP?': 'transport-protocols',
+    'How does routing work at a high level?': 'ip-routing',
+    'What does HTTP do?': 'transport-protocols',
+    'Explain the OSI model layers': 'osi-model',
+    'What is IP and how does IP addressing work?': 'ip-routing',
+    'What is DNS and how does it work?': 'dns',
+    # Database Management Systems
+    'What are ACID properties and why are they important?': 'acid',
+    'Explain normalization and its forms': 'normalization',
+    'What is the difference between SQL and NoSQL?': 'sql-nosql',
+    'What is a primary key and foreign key?': 'keys',
+    'Explain joins in database queries': 'joins',
+    'What is indexing and why is it important?': 'indexing',
+    # Web Development
+    'What is the difference between frontend and backend?': 'frontend-backend',
+    'Explain REST API principles': 'rest-api',
+    'How does HTTP request-response work?': 'http',
+    'What are cookies and sessions?': 'cookies-sessions',
+    'Explain MVC architecture': 'mvc',
+    'What is CORS and why is it important?': 'cors',
+    # Artificial Intelligence
+    'What is machine learning and its types?': 'machine-learning',
+    'Explain supervised vs unsupervised learning': 'supervised-learning',
+    'What is neural network and deep learning?': 'neural-networks',
+    'What is overfitting and underfitting?': 'overfitting',
+    'Explain cluster analysis in machine learning': 'clustering',
+    'What are activation functions in neural networks?': 'activation-functions',
+    # Software Engineering
+    'What are SDLC models and their phases?': 'sdlc',
+    'Explain design patterns with examples': 'design-patterns',
+    'What is agile methodology?': 'agile',
+    'What is version control and why is it important?': 'version-control',
+    'Explain unit testing and test-driven development': 'unit-testing',
+    'What is CI/CD pipeline?': 'ci-cd',
+    # Compiler Design
+    'Explain lexical analysis and tokenization': 'lexical-analysis',
+    'What is the role of parser in compilation?': 'parsing',
+    'What is code generation?': 'code-generation',
+    'What is semantic analysis in compilation?': 'semantic-analysis',
+    'Explain the symbol table in compilers': 'symbol-tables',
+    'What is intermediate representation?': 'intermediate-representation',
+    # Discrete Mathematics
+    'What are sets and set operations?': 'sets',
+    'Explain graph theory basics': 'graph-theory',
+    'What is combinatorics and probability?': 'combinatorics',
+    'What are boolean algebra and logic gates?': 'boolean-algebra',
+    'Explain trees in discrete mathematics': 'overview',
+    'What is mathematical induction?': 'induction',
+}
+
+# (selected subject, doubt, subject and topic it must be answered from). Filler
+# words from example text must not count as a match, and a doubt asked under the
+# wrong subject must reach the subject whose trigger it names.
+ROUTED_DOUBTS = [
+    ('Compiler Design', 'hello', 'Compiler Design', 'overview'),
+    ('Operating Systems', 'give me another example', 'Operating Systems', 'overview'),
+    ('Computer Networks', 'tell me more', 'Computer Networks', 'overview'),
+    ('Compiler Design', 'ip address', 'Computer Networks', 'ip-routing'),
+    ('Compiler Design', 'How do semaphores prevent race conditions?', 'Operating Systems', 'synchronization'),
+    ('Database Management Systems', 'When should I use a hash table vs array?', 'Data Structures', 'hash-tables'),
+    ('Operating Systems', 'stack and queue', 'Data Structures', 'stacks-queues'),
+    ('Compiler Design', 'dependency injection', 'Compiler Design', 'overview'),
+    ('Data Structures', 'What is mathematical induction?', 'Discrete Mathematics', 'induction'),
+]
+
+# (subject, doubts asked in turn, topic each one must be answered from), posted
+# through one client so later doubts can follow up on earlier ones
+CONVERSATIONS = [
+    ('Operating Systems', ['deadlock', 'give me another example', 'explain it again'],
+     ['synchronization', 'synchronization', 'synchronization']),
+    ('Artificial Intelligence', ['what is overfitting?', 'what do you mean'], ['overfitting', 'overfitting']),
+    ('Data Structures', ['stack vs queue', 'Explain polymorphism in OOP'], ['stacks-queues', 'overview']),
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(name, timings, alloc_bytes, **extra):
+    timings = sorted(timings)
+    total = sum(timings)
+    result = {
+        "case": name,
+        "calls": len(timings),
+        "throughput_per_s": round(len(timings) / total, 1) if total else 0.0,
+        "mean_us": round(statistics.fmean(timings) * 1e6, 2),
+        "p50_us": round(percentile(timings, 50) * 1e6, 2),
+        "p95_us": round(percentile(timings, 95) * 1e6, 2),
+        "p99_us": round(percentile(timings, 99) * 1e6, 2),
+        "alloc_bytes_per_call": round(statistics.fmean(alloc_bytes), 1) if alloc_bytes else 0.0,
+    }
+    result.update(extra)
+    return result
+
+
+def measure_allocations(call, inputs):
+    """Mean peak traced bytes per call over the first ``ALLOC_SAMPLES`` inputs."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for args in inputs[:ALLOC_SAMPLES]:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            call(*args)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_case(name, call, inputs, repeat, cold, **extra):
+    """Time ``call(*args)`` for every input, ``repeat`` times.
+
+    With ``cold`` the response cache is cleared before every call, so the
+    numbers reflect classification and rendering rather than memoization.
+    """
+    timings = []
+    clock = time.perf_counter
+    for _ in range(repeat):
+        for args in inputs:
+            if cold:
+                app.RESPONSE_CACHE.clear()
+            start = clock()
+            call(*args)
+            timings.append(clock() - start)
+    if cold:
+        app.RESPONSE_CACHE.clear()
+    return summarize(name, timings, measure_allocations(call, inputs), cold=cold, **extra)
+
+
+def vocabulary():
+    """Words drawn from the knowledge base, so synthetic doubts hit real terms."""
+    words = set()
+    kb = app.SNAPSHOTS.current.knowledge
+    for branch, name in kb.samples:
+        subject = kb.subject(branch, name)
+        for topic in subject.topics + (subject.overview,):
+            text = " ".join(topic.triggers + topic.keywords + topic.examples) + " " + topic.summary
+            words.update(w for w in normalize_doubt(text).split() if w.isalpha())
+    return sorted(words)
+
+
+def synthetic_corpus(size, words_per_doubt, rng, words):
+    subjects = app.BRANCH_SUBJECTS[BRANCH]
+    return [
+        (BRANCH, rng.choice(subjects), " ".join(rng.choices(words, k=words_per_doubt)))
+        for _ in range(size)
+    ]
+
+
+def sample_corpus():
+    knowledge = app.SNAPSHOTS.current.knowledge
+    return [(branch, subject, q) for (branch, subject), qs in knowledge.samples.items() for q in qs]
+
+
+def check_samples():
+    """Every sample doubt must render and resolve to its topic in ``EXPECTED_TOPICS``,
+    every ``ROUTED_DOUBTS`` entry to its expected subject and topic, and every
+    ``CONVERSATIONS`` turn to its topic."""
+    failures = []
+    matched = 0
+    samples = sample_corpus()
+    for branch, subject, doubt in samples:
+        response = app.get_response(branch, subject, doubt)
+        topic = app.SNAPSHOTS.current.knowledge.resolve(branch, subject, normalize_doubt(doubt))
+        matched += topic.matched
+        expected = EXPECTED_TOPICS.get(doubt)
+        if "<h3>Definition</h3>" not in response:
+            failures.append(f"{subject}: {doubt!r} rendered no answer")
+        elif expected is None:
+            failures.append(f"{subject}: {doubt!r} has no entry in EXPECTED_TOPICS")
+        elif (topic.subject, topic.id) != (subject, expected):
+            failures.append(f"{subject}: {doubt!r} went to {topic.subject}/{topic.id}, expected {expected}")
+    for subject, doubt, expected_subject, expected in ROUTED_DOUBTS:
+        topic = app.SNAPSHOTS.current.knowledge.resolve(BRANCH, subject, normalize_doubt(doubt))
+        if (topic.subject, topic.id) != (expected_subject, expected):
+            failures.append(
+                f"{subject}: {doubt!r} went to {topic.subject}/{topic.id}, expected {expected_subject}/{expected}"
+            )
+    for subject, doubts, topics in CONVERSATIONS:
+        client = FLASK_APP.test_client()
+        for doubt, expected in zip(doubts, topics):
+            resp = client.post(
+                "/", data={"branch": BRANCH, "subject": subject, "doubt": doubt}, headers={"Accept": "application/json"}
+            )
+            topic_id = resp.get_json()["topic"]
+            if topic_id != expected:
+                failures.append(f"{subject}: {doubt!r} in a conversation went to {topic_id}, expected {expected}")
+    return {"samples": len(samples), "matched_topic": matched, "failures": failures}
+
+
+def route_caller(client):
+    def call(branch, subject, doubt):
+        resp = client.post("/", data={"branch": branch, "subject": subject, "doubt": doubt})
+        if resp.status_code != 200:
+            raise RuntimeError(f"POST / returned {resp.status_code}")
+    return call
+
+
+def run(sizes, lengths, repeat, seed):
+    rng = random.Random(seed)
+    words = vocabulary()
+    client = FLASK_APP.test_client()
+    route = route_caller(client)
+    results = []
+
+    samples = sample_corpus()
+    results.append(run_case("samples/get_response", app.get_response, samples, repeat, cold=True))
+    results.append(run_case("samples/get_response", app.get_response, samples, repeat, cold=False))
+    results.append(run_case("samples/route", route, samples, repeat, cold=True))
+
+    for size in sizes:
+        for length in lengths:
+            corpus = synthetic_corpus(size, length, rng, words)
+            extra = {"corpus_size": size, "words_per_doubt": length}
+            results.append(run_case("synthetic/get_response", app.get_response, corpus, 1, cold=True, **extra))
+            route_corpus = corpus[: max(1, size // 10)]
+            results.append(run_case("synthetic/route", route, route_corpus, 1, cold=True, **extra))
+    return results
+
+
+def compare(results, baseline_path):
+    """Print p50/p99 ratios against an earlier run; >1.0 means slower now."""
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+
+    def key(r):
+        return (r["case"], r.get("cold"), r.get("corpus_size"), r.get("words_per_doubt"))
+
+    previous = {key(r): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for r in results:
+        old = previous.get(key(r))
+        if old is None or not old["p50_us"] or not old["p99_us"]:
+            continue
+        print(
+            f"  {describe(r):<58} p50 x{r['p50_us'] / old['p50_us']:.2f}"
+            f"  p99 x{r['p99_us'] / old['p99_us']:.2f}"
+        )
+
+
+def describe(r):
+    label = r["case"] + (" cold" if r.get("cold") else " warm")
+    if "corpus_size" in r:
+        label += f" n={r['corpus_size']} words={r['words_per_doubt']}"
+    return label
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000", help="comma-separated synthetic corpus sizes")
+    parser.add_argument("--lengths", default="8,64,512", help="comma-separated words per synthetic doubt")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the sample doubts")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="JSON from an earlier run to compare against")
+    parser.add_argument("--check", action="store_true", help="only check the sample doubts' topics")
+    args = parser.parse_args(argv)
+
+    check = check_samples()
+    print(f"Samples: {check['samples']} rendered, {check['matched_topic']} matched a specific topic")
+    for failure in check["failures"]:
+        print(f"  FAIL: {failure}")
+    if args.check:
+        return 1 if check["failures"] else 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    lengths = [int(n) for n in args.lengths.split(",") if n]
+    results = run(sizes, lengths, args.repeat, args.seed)
+
+    print(f"\n{'case':<58} {'ops/s':>10} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'alloc B':>9}")
+    for r in results:
+        print(
+            f"{describe(r):<58} {r['throughput_per_s']:>10} {r['p50_us']:>9} "
+            f"{r['p95_us']:>9} {r['p99_us']:>9} {r['alloc_bytes_per_call']:>9}"
+        )
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "check": check,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 1 if check["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Small in-process caches shared by the request handlers."""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache with hit/miss counters."""
+
+    __slots__ = ("maxsize", "hits", "misses", "_data", "_lock")
+
+    def __init__(self, maxsize: int = 1024):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after their last use.
+
+    Every read or write pushes an entry's expiry out, so least recently used is
+    also soonest to expire: expired entries are always at the front and are
+    dropped there as new ones arrive. At most ``maxsize`` entries are held.
+    """
+
+    __slots__ = ("maxsize", "ttl", "hits", "misses", "expired", "_data", "_lock")
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        if maxsize < 1 or ttl <= 0:
+            raise ValueError("maxsize must be at least 1 and ttl positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        # key -> (value, expiry on the monotonic clock)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None, now: float = None):
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[1] <= now:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._data[key] = (entry[0], now + self.ttl)
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, now: float = None) -> None:
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + self.ttl)
+            self._data.move_to_end(key)
+            data = self._data
+            while data:
+                oldest = next(iter(data.values()))
+                if oldest[1] > now and len(data) <= self.maxsize:
+                    break
+                if oldest[1] <= now:
+                    self.expired += 1
+                data.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+            "misses": self.misses, "expired": self.expired,
+        }
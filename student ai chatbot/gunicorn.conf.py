@@ -0,0 +1,50 @@
+"""Gunicorn settings for running the doubt solver on every core.
+
+    pip install gunicorn
+    gunicorn -c gunicorn.conf.py
+
+The app is preloaded: create_app() compiles the knowledge snapshot, loads the
+assets and warms the caches once in the master, then freezes that state for
+the garbage collector. Forked workers share those pages instead of each
+building and holding a copy. Tune with environment variables:
+
+    WEB_CONCURRENCY  worker processes (default: one per CPU)
+    WEB_THREADS      threads per worker (default: 4)
+    BIND             listen address (default: 0.0.0.0:8000)
+"""
+
+import gc
+import multiprocessing
+import os
+
+wsgi_app = "app:create_app(prefork=True)"
+preload_app = True
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("WEB_THREADS", "4"))
+worker_class = "gthread"
+
+# Answers are CPU-bound and fast; anything slower than this is stuck
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Collections in the master while loading would leave freed holes in pages
+# that workers then copy on write; the app freezes everything it built.
+gc.disable()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    # the worker's startup timeline counts from here, not from its first hook
+    import app
+
+    app.mark_fork()
+
+
+def post_worker_init(worker):
+    # the snapshot watcher thread does not survive fork; start one per worker
+    import app
+
+    app.start_worker()
@@ -0,0 +1,457 @@
+"""Knowledge base loader for the doubt solver.
+
+Topic content lives in JSON under ``knowledge/``: ``defaults.json`` holds the
+generic fallback answer and ``branches/*.json`` hold one branch each, with its
+subjects, sample doubts and topic rules. ``load_knowledge_base`` compiles those
+files; ``KnowledgeBase`` is the read-only view the app queries. Subjects are
+fetched through a loader on first use and kept in a bounded resident set, so
+the catalog (branches, subject names, sample doubts) is the only part that is
+always in memory. ``shards.py`` provides the memory-mapped loader.
+"""
+
+import json
+import os
+import sys
+
+from cache import LRUCache
+from matcher import KeywordMatcher
+from search import TRIGGER_HIT, SampleIndex, SearchIndex, SubjectRouter, tokenize
+from spelling import SpellIndex, build_vocabulary
+from suggest import SuggestIndex, suggestion_entries
+
+KNOWLEDGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge")
+
+# Topic id used for a subject's catch-all answer and for the generic fallback
+OVERVIEW = "overview"
+FALLBACK = "general"
+
+# Decoded subjects kept in memory per knowledge base; the rest stay on disk
+RESIDENT_SUBJECTS = 256
+
+# Share of the cross-subject trigger score another subject needs before it
+# answers a doubt the selected subject has nothing for
+DETECT_CONFIDENCE = 0.6
+
+# Cosine similarity to the closest sample doubt needed to answer with that
+# sample's topic when no keyword matched
+SAMPLE_SIMILARITY = 0.55
+
+# Phrases that refer back to the previous answer ("give me another example",
+# "explain it again"). Words such as "explain" or "why" start fresh questions
+# just as often, so they are not cues on their own.
+FOLLOW_UP_CUES = (
+    "another example", "more examples", "one more example", "different example",
+    "explain it again", "explain that again", "say that again", "once more", "again please",
+    "elaborate", "more detail", "in more detail", "go on", "continue", "tell me more",
+    "simpler", "more simply", "didn't understand", "don't understand", "didn't get",
+    "not clear", "unclear", "clarify", "what do you mean",
+)
+_FOLLOW_UP = KeywordMatcher([("follow-up", FOLLOW_UP_CUES)])
+
+# A follow-up is short and names nothing new: after dropping stopwords, cue words
+# and these fillers, no word of its own may be left
+FOLLOW_UP_MAX_WORDS = 8
+FOLLOW_UP_FILLER = frozenset(
+    tokenize(" ".join(FOLLOW_UP_CUES) + " please plz pls bit little some same previous last answer "
+             "again more one didn don t get still confused sorry ok okay thanks can could would")
+)
+
+# Longest doubt answered; anything longer is cut (see clip_doubt). Real questions
+# are a sentence or two, and the full text is echoed back in the answer.
+MAX_DOUBT_CHARS = 1000
+
+
+def normalize_doubt(doubt: str) -> str:
+    """Lowercase and collapse whitespace so multi-word keywords match regardless of spacing."""
+    return " ".join(doubt.lower().split())
+
+
+def is_follow_up(text: str) -> bool:
+    """True when normalized doubt ``text`` refers back to an earlier answer: it has a
+    follow-up cue, is at most ``FOLLOW_UP_MAX_WORDS`` words and has no content
+    words of its own ("another example please", not "another example of kubernetes")."""
+    if len(text.split()) > FOLLOW_UP_MAX_WORDS or _FOLLOW_UP.first_match(text) is None:
+        return False
+    return all(token in FOLLOW_UP_FILLER for token in tokenize(text))
+
+
+def clip_doubt(doubt: str) -> str:
+    """``doubt`` stripped and cut to at most ``MAX_DOUBT_CHARS``, at a word boundary if
+    one is near. Everything downstream is linear in this length, so clipping once
+    up front bounds the cost of answering any input."""
+    doubt = doubt.strip()
+    if len(doubt) <= MAX_DOUBT_CHARS:
+        return doubt
+    clipped = doubt[:MAX_DOUBT_CHARS]
+    cut = clipped.rfind(" ", MAX_DOUBT_CHARS - 40)
+    return (clipped[:cut] if cut > 0 else clipped).rstrip() + "…"
+
+
+class Topic:
+    """One answerable topic: the sections rendered for a matched doubt."""
+
+    __slots__ = (
+        "branch", "subject", "id", "triggers", "definition", "examples", "industry", "keywords", "summary",
+    )
+
+    def __init__(self, branch, subject, topic_id, triggers, definition, examples, industry, keywords, summary):
+        self.branch = branch
+        self.subject = subject
+        self.id = topic_id
+        self.triggers = triggers
+        self.definition = definition
+        self.examples = examples
+        self.industry = industry
+        self.keywords = keywords
+        self.summary = summary
+
+    @property
+    def key(self):
+        return (self.branch, self.subject, self.id)
+
+    @property
+    def matched(self) -> bool:
+        """False for a subject overview or the generic fallback answer."""
+        return self.id not in (OVERVIEW, FALLBACK)
+
+    @property
+    def outcome(self) -> str:
+        """``"matched"``, ``"overview"`` (subject catch-all) or ``"fallback"`` (generic answer)."""
+        if self.id == OVERVIEW:
+            return "overview"
+        return "fallback" if self.id == FALLBACK else "matched"
+
+    def __repr__(self):
+        return f"Topic({self.branch!r}, {self.subject!r}, {self.id!r})"
+
+
+class Subject:
+    """A subject within a branch, with its topics in source-file order."""
+
+    __slots__ = ("branch", "name", "samples", "topics", "overview", "_index")
+
+    def __init__(self, branch, name, samples, topics, overview, index=None):
+        self.branch = branch
+        self.name = name
+        self.samples = samples
+        self.topics = topics
+        self.overview = overview
+        # a compiled snapshot passes the index it stored; otherwise it is built on demand
+        self._index = index
+
+    @property
+    def index(self) -> SearchIndex:
+        """BM25 over this subject's topics; the overview is indexed too so a doubt
+        that only matches general subject text can still land on it. Built on
+        first use."""
+        if self._index is None:
+            self._index = SearchIndex(self.topics + (self.overview,))
+        return self._index
+
+
+class Answer:
+    """What one doubt was answered with; the unit every renderer works from.
+
+    ``topic`` holds the sections (definition, examples, industry, keywords,
+    summary); the rest is the request it answers: the branch and subject the
+    student picked, the clipped question, and whether it was answered as a
+    follow-up to the conversation's previous topic.
+    """
+
+    __slots__ = ("topic", "branch", "subject", "question", "follow_up")
+
+    def __init__(self, topic, branch, subject, question, follow_up=False):
+        self.topic = topic
+        self.branch = branch
+        self.subject = subject
+        self.question = question
+        self.follow_up = follow_up
+
+    @property
+    def detected(self) -> bool:
+        """True when the topic comes from a subject other than the one picked."""
+        return bool(self.topic.subject) and (self.topic.branch, self.topic.subject) != (self.branch, self.subject)
+
+    def __repr__(self):
+        return f"Answer({self.topic!r}, {self.branch!r}, {self.subject!r}, {self.question!r}, {self.follow_up!r})"
+
+
+class KnowledgeBase:
+    """Read-only view over every branch, subject and topic.
+
+    Only the catalog, the spelling index, the subject router, the sample
+    question index and the typeahead index are held eagerly. ``load(branch,
+    name)`` returns the full ``Subject``; the most recently used ``resident``
+    subjects stay decoded.
+    """
+
+    __slots__ = (
+        "branches", "samples", "fallback", "topic_count", "speller", "router", "similar", "suggester",
+        "fingerprint", "_load", "_resident",
+    )
+
+    def __init__(
+        self, branches, samples, fallback, load, topic_count, speller=None, router=None, fingerprint="",
+        resident=RESIDENT_SUBJECTS, similar=None, suggester=None,
+    ):
+        # branch -> tuple of subject names, in display order
+        self.branches = branches
+        # (branch, subject) -> tuple of sample doubts
+        self.samples = samples
+        self.fallback = fallback
+        # topics across all subjects, including each subject's overview
+        self.topic_count = topic_count
+        # corrects misspelled trigger words before ranking; None disables it
+        self.speller = speller
+        # trigger-only index over every subject; None disables subject detection
+        self.router = router
+        # nearest sample doubt and its topic; None disables the lookup
+        self.similar = similar
+        # completions for the doubt box; None disables them
+        self.suggester = suggester
+        self.fingerprint = fingerprint
+        self._load = load
+        self._resident = LRUCache(resident)
+
+    def subject(self, branch: str, name: str):
+        """The ``Subject`` for ``(branch, name)``, loading it on first use; None if unknown."""
+        key = (branch, name)
+        if key not in self.samples:
+            return None
+        entry = self._resident.get(key)
+        if entry is None:
+            entry = self._load(branch, name)
+            self._resident.put(key, entry)
+        return entry
+
+    def get(self, branch: str, subject: str, topic_id: str):
+        entry = self.subject(branch, subject)
+        if entry is None:
+            return None
+        if topic_id == OVERVIEW:
+            return entry.overview
+        return next((t for t in entry.topics if t.id == topic_id), None)
+
+    def correct(self, text: str) -> str:
+        """Normalized doubt ``text`` with misspelled trigger words fixed."""
+        return self.speller.correct(text) if self.speller is not None else text
+
+    def classify(self, branch: str, subject: str, text: str, k: int = 3):
+        """Return ``(topic, ranked, confidence)``: the answer topic, the top ``k``
+        scored topics, and the detection confidence when another subject answered.
+
+        A topic of the selected subject whose trigger the doubt names answers it.
+        Otherwise (the best hit is the overview, comes only from Important
+        Keywords or example text, or there is none) every subject's triggers are
+        scored at once, and another subject winning at least
+        ``DETECT_CONFIDENCE`` of the score answers instead, unless the doubt
+        names the selected subject ("trees in discrete mathematics"). Failing that, the
+        selected subject's best hit answers if it has one; a hit by example or
+        summary words alone only counts from ``MIN_TEXT_SCORE``. Then a doubt at
+        least ``SAMPLE_SIMILARITY`` alike to a known sample doubt gets that
+        sample's topic (the similarity is the confidence when it is another
+        subject's). Otherwise the answer is the subject overview, or the generic
+        fallback for an unknown branch/subject. Misspelled trigger words are
+        corrected first.
+        """
+        text = self.correct(text)
+        entry = self.subject(branch, subject)
+        ranked = entry.index.rank(branch, subject, text, k) if entry is not None else []
+        if ranked and ranked[0][2] == TRIGGER_HIT and ranked[0][0].matched:
+            return ranked[0][0], _scored(ranked), None
+
+        detected = self.router.detect(text) if self.router is not None and not _names(text, subject) else None
+        if detected is not None and detected[4] >= DETECT_CONFIDENCE and detected[:2] != (branch, subject):
+            other = self.subject(detected[0], detected[1])
+            found = other.index.rank(detected[0], detected[1], text, k) if other is not None else []
+            if found:
+                return found[0][0], _scored(found), detected[4]
+        if ranked:
+            return ranked[0][0], _scored(ranked), None
+
+        nearest = self.similar.nearest(text) if self.similar is not None else None
+        if nearest is not None and nearest[4] >= SAMPLE_SIMILARITY:
+            topic = self.get(nearest[0], nearest[1], nearest[2])
+            if topic is not None:
+                other = (nearest[0], nearest[1]) != (branch, subject)
+                return topic, [(topic, nearest[4])], nearest[4] if other else None
+        return (entry.overview if entry is not None else self.fallback), [], None
+
+    def suggest(self, prefix: str, k: int) -> list:
+        """Up to ``k`` sample doubts and trigger keywords completing ``prefix``."""
+        return self.suggester.complete(prefix, k) if self.suggester is not None else []
+
+    def resolve(self, branch: str, subject: str, text: str) -> Topic:
+        """Answer topic for normalized doubt ``text``, possibly from a detected subject."""
+        return self.classify(branch, subject, text, 1)[0]
+
+    def resident_stats(self) -> dict:
+        """Decoded subjects in memory; ``misses`` counts subject loads."""
+        return self._resident.stats()
+
+    @property
+    def branch_subjects(self) -> dict:
+        return {branch: list(names) for branch, names in self.branches.items()}
+
+    @property
+    def sample_doubts(self) -> dict:
+        """Branch -> subject -> sample doubts; subject names are only unique within a branch."""
+        result = {branch: {} for branch in self.branches}
+        for (branch, name), samples in self.samples.items():
+            result[branch][name] = list(samples)
+        return result
+
+
+def _strings(values, where):
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"{where}: expected a list of strings")
+    return tuple(sys.intern(v) for v in values)
+
+
+def _string(value, where):
+    if not isinstance(value, str):
+        raise ValueError(f"{where}: expected a string")
+    return sys.intern(value)
+
+
+def _object(value, where):
+    if not isinstance(value, dict):
+        raise ValueError(f"{where}: expected an object")
+    return value
+
+
+def _list(value, where):
+    if not isinstance(value, list):
+        raise ValueError(f"{where}: expected a list")
+    return value
+
+
+def _topic(data, branch, subject, topic_id, definition, default_summary, where):
+    return Topic(
+        branch,
+        subject,
+        topic_id,
+        _strings(data.get("triggers", []), f"{where}.triggers"),
+        definition,
+        _strings(data.get("examples", []), f"{where}.examples"),
+        _string(data.get("industry", ""), f"{where}.industry"),
+        _strings(data.get("keywords", []), f"{where}.keywords"),
+        _string(data.get("summary", default_summary), f"{where}.summary"),
+    )
+
+
+def _load_json(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def read_sources(directory: str = KNOWLEDGE_DIR):
+    """Parse the JSON sources under ``directory`` into ``(branches, subjects, fallback)``.
+
+    ``branches`` maps a branch to its subject names and ``subjects`` maps
+    ``(branch, name)`` to a ``Subject``. Raises ``ValueError`` with the offending
+    location when a file is malformed, so bad content fails at build time rather
+    than on the first matching request.
+    """
+    defaults = _object(_load_json(os.path.join(directory, "defaults.json")), "defaults.json")
+    default_summary = _string(defaults.get("summary"), "defaults.summary")
+    fallback = _topic(
+        defaults, "", "", FALLBACK,
+        _string(defaults.get("definition"), "defaults.definition"),
+        default_summary, "defaults",
+    )
+
+    branches = {}
+    subjects = {}
+    branch_dir = os.path.join(directory, "branches")
+    for filename in sorted(os.listdir(branch_dir)):
+        if not filename.endswith(".json"):
+            continue
+        data = _object(_load_json(os.path.join(branch_dir, filename)), filename)
+        branch = _string(data.get("branch"), f"{filename}.branch")
+        if branch in branches:
+            raise ValueError(f"{filename}: duplicate branch {branch!r}")
+
+        names = []
+        for i, s in enumerate(_list(data.get("subjects", []), f"{filename}.subjects")):
+            s = _object(s, f"{filename}.subjects[{i}]")
+            name = _string(s.get("name"), f"{filename}.subjects[{i}].name")
+            where = f"{filename}:{name}"
+            if name in names:
+                raise ValueError(f"{where}: duplicate subject {name!r}")
+            definition = _string(s.get("definition", fallback.definition), f"{where}.definition")
+
+            topics = []
+            for j, t in enumerate(_list(s.get("topics", []), f"{where}.topics")):
+                t = _object(t, f"{where}.topics[{j}]")
+                topic_id = _string(t.get("id"), f"{where}.topics.id")
+                if topic_id == OVERVIEW or any(topic_id == other.id for other in topics):
+                    raise ValueError(f"{where}: duplicate topic {topic_id!r}")
+                topic_where = f"{where}.{topic_id}"
+                if not t.get("triggers"):
+                    raise ValueError(f"{topic_where}: a topic needs at least one trigger")
+                topics.append(_topic(t, branch, name, topic_id, definition, default_summary, topic_where))
+
+            overview = _topic(
+                _object(s.get("overview", {}), f"{where}.overview"), branch, name, OVERVIEW, definition, default_summary, f"{where}.overview"
+            )
+            subjects[(branch, name)] = Subject(
+                branch, name, _strings(s.get("samples", []), f"{where}.samples"),
+                tuple(topics), overview,
+            )
+            names.append(name)
+        branches[branch] = tuple(names)
+
+    return branches, subjects, fallback
+
+
+def _names(text: str, subject: str) -> bool:
+    # whole words, so "os" in a subject name does not match inside "cost"
+    return f" {' '.join(tokenize(subject))} " in f" {' '.join(tokenize(text))} "
+
+
+def _scored(ranked) -> list:
+    # (topic, score, hit) -> (topic, score)
+    return [(topic, score) for topic, score, _ in ranked]
+
+
+def router_entries(subjects) -> tuple:
+    """``(branch, subject, topic id, triggers)`` for every topic, for ``SubjectRouter``."""
+    return tuple(
+        (s.branch, s.name, t.id, t.triggers) for s in subjects for t in s.topics + (s.overview,) if t.triggers
+    )
+
+
+def sample_entries(subjects) -> tuple:
+    """``(branch, subject, sample, topic id)`` for every sample doubt that one of
+    its subject's topics answers, for ``SampleIndex``. A sample already indexed
+    for an earlier subject is left out; that one would win every tie anyway."""
+    entries = []
+    seen = set()
+    for s in subjects:
+        for sample in s.samples:
+            text = normalize_doubt(sample)
+            if text in seen:
+                continue
+            ranked = s.index.rank(s.branch, s.name, text, 1)
+            if ranked and ranked[0][0].id != OVERVIEW:
+                seen.add(text)
+                entries.append((s.branch, s.name, sample, ranked[0][0].id))
+    return tuple(entries)
+
+
+def load_knowledge_base(directory: str = KNOWLEDGE_DIR) -> KnowledgeBase:
+    """Parse the JSON sources and keep every subject in memory (no shards)."""
+    branches, subjects, fallback = read_sources(directory)
+    return KnowledgeBase(
+        branches,
+        {key: s.samples for key, s in subjects.items()},
+        fallback,
+        lambda branch, name: subjects[(branch, name)],
+        sum(len(s.topics) + 1 for s in subjects.values()),
+        SpellIndex(*build_vocabulary(t for s in subjects.values() for t in s.topics + (s.overview,))),
+        SubjectRouter(router_entries(subjects.values())),
+        resident=max(1, len(subjects)),
+        similar=SampleIndex(sample_entries(subjects.values())),
+        suggester=SuggestIndex(suggestion_entries(subjects.values())),
+    )
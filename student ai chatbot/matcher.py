@@ -0,0 +1,127 @@
+"""Single-pass keyword matching for the doubt classifier.
+
+Each subject's rules are compiled once into an Aho-Corasick automaton so a doubt
+is scanned exactly once, no matter how many rules or keywords a subject has.
+Matches are only accepted on word boundaries, which stops short keywords such as
+"ip" or "ci" from firing inside "ship" or "decision".
+"""
+
+# Keywords this short are treated as acronyms/whole words ("ip", "ci", "dns"):
+# they must end on a word boundary, optionally followed by a plural "s".
+# Longer keywords act as stems, so "sort" still matches "sorting".
+SHORT_KEYWORD = 3
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum()
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over an ordered list of ``(label, keywords)`` rules.
+
+    Rule order is priority order: when several rules match, the one listed first
+    wins, exactly like the original ``if/elif`` ladder.
+    """
+
+    __slots__ = ("labels", "_goto", "_fail", "_out")
+
+    def __init__(self, rules):
+        self.labels = []
+        self._goto = [{}]
+        self._out = [[]]
+
+        for rule_index, (label, keywords) in enumerate(rules):
+            self.labels.append(label)
+            for keyword in keywords:
+                self._add(keyword.lower(), rule_index)
+
+        self._fail = [0] * len(self._goto)
+        self._build_failure_links()
+
+    def to_state(self) -> tuple:
+        """The compiled automaton as plain tuples, lists and dicts (``marshal``-able)."""
+        return (tuple(self.labels), self._goto, self._fail, self._out)
+
+    @classmethod
+    def from_state(cls, state) -> "KeywordMatcher":
+        """Rebuild a matcher from ``to_state()`` output without recompiling it."""
+        matcher = cls.__new__(cls)
+        labels, matcher._goto, matcher._fail, matcher._out = state
+        matcher.labels = list(labels)
+        return matcher
+
+    def _add(self, keyword: str, rule_index: int) -> None:
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._out.append([])
+            state = nxt
+        strict_end = len(keyword) <= SHORT_KEYWORD
+        self._out[state].append((len(keyword), rule_index, strict_end))
+
+    def _build_failure_links(self) -> None:
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _scan(self, text: str):
+        """Yield ``(start, end, rule_index)`` for every boundary-respecting keyword hit."""
+        goto, fail, out = self._goto, self._fail, self._out
+        n = len(text)
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, rule_index, strict_end in out[state]:
+                start = i - length + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                end = i + 1
+                if strict_end:
+                    if end < n and text[end] == "s":
+                        end += 1
+                    if end < n and _is_word_char(text[end]):
+                        continue
+                yield start, end, rule_index
+
+    def find_all(self, text: str) -> list:
+        """Return matched labels in order of first appearance in ``text``.
+
+        A hit lying entirely inside a longer hit is ignored, so "neural network"
+        does not also count as "neural".
+        """
+        hits = sorted(self._scan(text), key=lambda h: (h[0], -h[1]))
+        found = []
+        reach = -1
+        for _, end, rule_index in hits:
+            if end > reach:
+                reach = end
+                label = self.labels[rule_index]
+                if label not in found:
+                    found.append(label)
+        return found
+
+    def first_match(self, text: str):
+        """Return the label of the highest-priority matching rule, or ``None``."""
+        best = None
+        for _, _, rule_index in self._scan(text):
+            if best is None or rule_index < best:
+                best = rule_index
+                if best == 0:
+                    break
+        return None if best is None else self.labels[best]
@@ -0,0 +1,186 @@
+"""Lightweight in-process metrics with Prometheus text exposition.
+
+Counters and histograms keep one shard per thread, so recording a value is a
+plain dict update with no lock. Shards are summed only when ``/metrics`` is
+scraped. When a thread goes away its shard is folded into a retired total, so
+thread-per-request servers do not grow the shard list forever.
+"""
+
+import bisect
+import threading
+import weakref
+
+# Latency buckets in seconds, from 50 microseconds up to 2.5 seconds
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{v}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class _Sharded:
+    """Per-thread storage of ``labels -> value`` with a merge on scrape."""
+
+    kind = ""
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            weakref.finalize(threading.current_thread(), self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            try:
+                self._shards.remove(shard)
+            except ValueError:
+                return
+            self._merge_into(self._retired, shard)
+
+    def _merge_into(self, target, shard):
+        raise NotImplementedError
+
+    def _collect(self) -> dict:
+        with self._lock:
+            merged = {}
+            self._merge_into(merged, self._retired)
+            for shard in list(self._shards):
+                self._merge_into(merged, shard)
+        return merged
+
+    def expose(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def _merge_into(self, target, shard):
+        for key, value in list(shard.items()):
+            target[key] = target.get(key, 0) + value
+
+    def value(self, *labelvalues):
+        return self._collect().get(labelvalues, 0)
+
+    def expose(self):
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in sorted(self._collect().items())
+        ]
+
+
+class Histogram(_Sharded):
+    """Fixed-bucket histogram; each label set stores per-bucket counts, sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, documentation, labelnames)
+
+    def observe(self, value, *labelvalues):
+        shard = self._shard()
+        cell = shard.get(labelvalues)
+        if cell is None:
+            # bucket counts (last one is +Inf), then sum
+            cell = shard[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def _merge_into(self, target, shard):
+        for key, cell in list(shard.items()):
+            total = target.get(key)
+            if total is None:
+                target[key] = list(cell)
+            else:
+                for i, v in enumerate(cell):
+                    total[i] += v
+
+    def expose(self):
+        lines = []
+        for key, cell in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), cell):
+                cumulative += count
+                le = (("le", _number(float(bound))),)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(cell[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Callback:
+    """Metric whose value is read from a callback at scrape time.
+
+    ``kind`` is ``"gauge"`` or, for values that only ever grow, ``"counter"``.
+    """
+
+    def __init__(self, registry, name, documentation, callback, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+        if registry is not None:
+            registry.register(self)
+
+    def expose(self):
+        return [f"{self.name} {_number(self.callback())}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        if any(m.name == metric.name for m in self._metrics):
+            raise ValueError(f"metric {metric.name!r} already registered")
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,272 @@
+"""Append-only log of answered doubts, and an offline report over it.
+
+Request handlers call ``QueryLog.record``, which only stores a tuple in a
+fixed-size ring buffer under a lock. A background thread drains the ring in
+batches, encodes the entries as JSON lines and appends each batch to the log
+file with a single write. When the ring is full (the disk is slow or the
+thread is behind), new entries are dropped and counted instead of making
+requests wait.
+
+Each line holds the time, the selected branch and subject, the answering
+topic, its outcome (``matched``, ``overview`` or ``fallback``), the time spent
+answering, and the normalized doubt (or only its hash).
+
+Run the module to aggregate a log in one streaming pass:
+
+    python querylog.py logs/queries.jsonl --top 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+from knowledge import clip_doubt, normalize_doubt
+
+# Entries buffered before new ones are dropped
+RING_SIZE = 8192
+
+# Seconds between flushes, and the fill level that triggers one early
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 512
+
+# Selected branch and subject are user input; longer values are cut
+MAX_NAME_CHARS = 200
+
+
+class QueryLog:
+    """Ring-buffered, batched writer of query log lines to ``path``."""
+
+    def __init__(self, path: str, text: bool = True, size: int = RING_SIZE,
+                 interval: float = FLUSH_INTERVAL, batch: int = FLUSH_BATCH):
+        self.path = path
+        # False: store a hash of each doubt instead of its text
+        self.text = text
+        self.interval = interval
+        self.batch = batch
+        self.written = 0
+        self.dropped = 0
+        self._ring = [None] * size
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, branch: str, subject: str, doubt: str, topic, seconds: float) -> bool:
+        """Queue one answered doubt; False (and counted) if the ring is full."""
+        entry = (
+            time.time(), branch[:MAX_NAME_CHARS], subject[:MAX_NAME_CHARS], clip_doubt(doubt),
+            topic.branch, topic.subject, topic.id, topic.outcome, seconds,
+        )
+        ring = self._ring
+        with self._lock:
+            if self._count == len(ring):
+                self.dropped += 1
+                return False
+            ring[(self._head + self._count) % len(ring)] = entry
+            self._count += 1
+            count = self._count
+        if count >= self.batch:
+            self._wake.set()
+        return True
+
+    def _drain(self) -> list:
+        ring = self._ring
+        with self._lock:
+            head, count = self._head, self._count
+            end = head + count
+            if end <= len(ring):
+                entries = ring[head:end]
+            else:
+                entries = ring[head:] + ring[:end - len(ring)]
+            for i in range(head, end):
+                ring[i % len(ring)] = None
+            self._head = end % len(ring)
+            self._count = 0
+        return entries
+
+    def _line(self, entry) -> str:
+        ts, branch, subject, doubt, topic_branch, topic_subject, topic_id, outcome, seconds = entry
+        record = {
+            "ts": round(ts, 3), "branch": branch, "subject": subject,
+            "topic_branch": topic_branch, "topic_subject": topic_subject, "topic": topic_id,
+            "outcome": outcome, "ms": round(seconds * 1000, 3),
+        }
+        doubt = normalize_doubt(doubt)
+        if self.text:
+            record["doubt"] = doubt
+        else:
+            record["doubt_sha"] = hashlib.sha256(doubt.encode("utf-8")).hexdigest()[:16]
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of lines written."""
+        entries = self._drain()
+        if not entries:
+            return 0
+        data = "".join(self._line(e) for e in entries).encode("utf-8")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # one O_APPEND write per batch, so workers sharing the file never interleave lines
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        self.written += len(entries)
+        return len(entries)
+
+    def start(self) -> None:
+        """Start the flushing thread (once per process; threads do not survive fork)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                try:
+                    self.flush()
+                except OSError:
+                    # the entries are lost, the requests are not; try again next time
+                    pass
+            self.flush()
+
+        self._thread = threading.Thread(target=run, name="query-log", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Flush what is buffered and stop the thread."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class HeavyHitters:
+    """Misra-Gries frequent items summary in at most ``capacity`` counters.
+
+    Any item seen more than ``n / (capacity + 1)`` times in ``n`` adds is kept,
+    and each kept count is at most that much below the true count.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+
+    def add(self, item) -> None:
+        self.total += 1
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+        elif len(counts) < self.capacity:
+            counts[item] = 1
+        else:
+            # every counter pays for the newcomer; the total decrement never exceeds the adds
+            for key in list(counts):
+                counts[key] -= 1
+                if not counts[key]:
+                    del counts[key]
+
+    def top(self, k: int) -> list:
+        return sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+
+
+def read_log(path: str):
+    """Yield every well-formed record of the log at ``path``, one line at a time."""
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "outcome" in record:
+                yield record
+
+
+def summarize(records, top: int = 20) -> dict:
+    """Aggregate records in one pass: outcomes, unanswered doubts, topic hits."""
+    outcomes = {}
+    subjects = {}
+    topics = {}
+    unanswered = HeavyHitters(max(1000, top * 50))
+    for record in records:
+        outcome = record["outcome"]
+        count, ms = outcomes.get(outcome, (0, 0.0))
+        outcomes[outcome] = (count + 1, ms + record.get("ms", 0.0))
+        key = (record.get("branch", ""), record.get("subject", ""))
+        asked, missed = subjects.get(key, (0, 0))
+        subjects[key] = (asked + 1, missed + (outcome != "matched"))
+        if outcome == "matched":
+            topic = (record.get("topic_branch", ""), record.get("topic_subject", ""), record.get("topic", ""))
+            topics[topic] = topics.get(topic, 0) + 1
+        else:
+            unanswered.add((key[1], record.get("doubt") or record.get("doubt_sha", "")))
+
+    total = sum(count for count, _ in outcomes.values())
+    return {
+        "total": total,
+        "outcomes": {
+            name: {"count": count, "share": round(count / total, 4), "mean_ms": round(ms / count, 3)}
+            for name, (count, ms) in sorted(outcomes.items())
+        },
+        "unanswered": [
+            {"subject": subject, "doubt": doubt, "count": count} for (subject, doubt), count in unanswered.top(top)
+        ],
+        "subjects": [
+            {"branch": b, "subject": s, "asked": asked, "unanswered": missed, "unanswered_share": round(missed / asked, 4)}
+            for (b, s), (asked, missed) in sorted(subjects.items(), key=lambda kv: -kv[1][1])
+        ][:top],
+        "topics": [
+            {"branch": b, "subject": s, "topic": t, "hits": hits}
+            for (b, s, t), hits in sorted(topics.items(), key=lambda kv: -kv[1])
+        ][:top],
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['total']} doubts")
+    for name, row in report["outcomes"].items():
+        print(f"  {name:<10} {row['count']:>9} {row['share']:>8.1%} {row['mean_ms']:>9} ms")
+
+    print("\nTop unanswered doubts (overview or fallback)")
+    for row in report["unanswered"]:
+        print(f"  {row['count']:>7}  {row['subject'][:24]:<24} {row['doubt'][:80]}")
+
+    print("\nSubjects by unanswered doubts")
+    for row in report["subjects"]:
+        print(f"  {row['unanswered']:>7} of {row['asked']:<7} {row['unanswered_share']:>7.1%}  {row['subject']}")
+
+    print("\nMost answered topics")
+    for row in report["topics"]:
+        print(f"  {row['hits']:>7}  {row['subject']} / {row['topic']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize a query log: unanswered doubts and topic hits.")
+    parser.add_argument("log", help="query log written by the app (QUERY_LOG)")
+    parser.add_argument("--top", type=int, default=20, help="rows per table")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = summarize(read_log(args.log), args.top)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
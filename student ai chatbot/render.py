@@ -0,0 +1,229 @@
+"""Rendering of answers as HTML, JSON, Markdown or plain text.
+
+An ``Answer`` (see knowledge.py) is rendered as a per-request intro (the
+echoed question and which subject answered it) followed by the topic's body.
+Topic bodies never change between requests, so each one is rendered the first
+time it is served in a format and kept in a bounded cache. Answering a doubt
+then only needs the intro joined to a cached body, and a client asking for
+JSON or Markdown never pays for HTML.
+"""
+
+import hashlib
+import re
+from html import escape
+
+from cache import LRUCache
+
+# Rendered topics kept per fragment store
+RENDERED_TOPICS = 4096
+
+FOOTER = (
+    "<p class=\"response-footer\">"
+    "Feel free to refine your question or ask for a concrete example; I'm happy to help further!"
+    "</p>"
+)
+
+
+# Formats FragmentStore.render produces, by media type, in preference order
+FORMATS = {
+    "text/html": "html",
+    "application/json": "json",
+    "text/markdown": "markdown",
+    "text/plain": "text",
+}
+
+# Characters that could start Markdown (or inline HTML) inside a sentence
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_\[\]<>#|~])")
+
+
+def make_list(items):
+    return "<ul>" + "".join(f"<li>{item}</li>" for item in items) + "</ul>"
+
+
+def render_intro(branch: str, subject: str, question: str, selected: str = "") -> str:
+    # echo the question for clarity; it and an unknown branch/subject are user input
+    branch, subject, question, selected = escape(branch), escape(subject), escape(question), escape(selected)
+    intro = (
+        f"<p class=\"response-question\"><strong>Q:</strong> {question}</p>"
+        f"<p class=\"response-intro\">Hi there! As your friendly engineering professor, here is a clear, concise explanation "
+        f"for your doubt about <strong>{subject}</strong> in <strong>{branch}</strong>.</p>"
+    )
+    if selected:
+        intro += (
+            f"<p class=\"response-detected\">You picked <strong>{selected}</strong>, but this doubt looks like "
+            f"<strong>{subject}</strong>, so the answer comes from there.</p>"
+        )
+    return intro
+
+
+def render_follow_up_intro(topic, question: str) -> str:
+    """Intro for a doubt answered from the previous topic of the conversation."""
+    return (
+        f"<p class=\"response-question\"><strong>Q:</strong> {escape(question)}</p>"
+        f"<p class=\"response-intro\">Following up on <strong>{escape(_topic_label(topic))}</strong> in "
+        f"<strong>{escape(topic.subject)}</strong>, here it is again with everything in one place.</p>"
+    )
+
+
+def render_body(topic) -> str:
+    """Render everything after the intro: the topic's sections plus the footer."""
+    # Nicely format the response with conditional sections
+    resp = [f"<h3>Definition</h3><p>{topic.definition}</p>"]
+    if topic.examples:
+        resp.append(f"<h3>Real-world Examples</h3>{make_list(topic.examples)}")
+    if topic.industry:
+        resp.append(f"<h3>Industry Application</h3><p>{topic.industry}</p>")
+    if topic.keywords:
+        resp.append(f"<h3>Important Keywords</h3>{make_list(topic.keywords)}")
+    if topic.summary:
+        resp.append(f"<h3>Short Summary</h3><p>{topic.summary}</p>")
+    resp.append(FOOTER)
+    return "\n".join(resp)
+
+
+def _topic_label(topic) -> str:
+    return topic.id.replace("-", " ")
+
+
+def _intro_sentences(answer) -> list:
+    """The intro as plain sentences, shared by the Markdown and text renderers."""
+    topic = answer.topic
+    if answer.follow_up:
+        return [
+            f"Following up on {_topic_label(topic)} in {topic.subject}, "
+            "here it is again with everything in one place."
+        ]
+    branch, subject = (topic.branch, topic.subject) if answer.detected else (answer.branch, answer.subject)
+    sentences = [
+        "Hi there! As your friendly engineering professor, here is a clear, concise explanation "
+        f"for your doubt about {subject} in {branch}."
+    ]
+    if answer.detected:
+        sentences.append(
+            f"You picked {answer.subject}, but this doubt looks like {subject}, so the answer comes from there."
+        )
+    return sentences
+
+
+def _markdown_escape(text: str) -> str:
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", text)
+
+
+def render_markdown_intro(answer) -> str:
+    lines = [f"**Q:** {_markdown_escape(answer.question)}"]
+    lines.extend(_markdown_escape(s) for s in _intro_sentences(answer))
+    return "\n\n".join(lines)
+
+
+def render_markdown_body(topic) -> str:
+    parts = [f"### Definition\n\n{topic.definition}"]
+    if topic.examples:
+        parts.append("### Real-world Examples\n\n" + "\n".join(f"- {e}" for e in topic.examples))
+    if topic.industry:
+        parts.append(f"### Industry Application\n\n{topic.industry}")
+    if topic.keywords:
+        parts.append("### Important Keywords\n\n" + "\n".join(f"- {k}" for k in topic.keywords))
+    if topic.summary:
+        parts.append(f"### Short Summary\n\n{topic.summary}")
+    parts.append("_Feel free to refine your question or ask for a concrete example; I'm happy to help further!_")
+    return "\n\n".join(parts) + "\n"
+
+
+def render_text_intro(answer) -> str:
+    return "\n".join([f"Q: {answer.question}"] + _intro_sentences(answer))
+
+
+def render_text_body(topic) -> str:
+    parts = [f"Definition\n  {topic.definition}"]
+    if topic.examples:
+        parts.append("Real-world Examples\n" + "\n".join(f"  - {e}" for e in topic.examples))
+    if topic.industry:
+        parts.append(f"Industry Application\n  {topic.industry}")
+    if topic.keywords:
+        parts.append("Important Keywords\n" + "\n".join(f"  - {k}" for k in topic.keywords))
+    if topic.summary:
+        parts.append(f"Short Summary\n  {topic.summary}")
+    parts.append("Feel free to refine your question or ask for a concrete example; I'm happy to help further!")
+    return "\n\n".join(parts) + "\n"
+
+
+def render_html_intro(answer) -> str:
+    topic = answer.topic
+    if answer.follow_up:
+        return render_follow_up_intro(topic, answer.question)
+    if answer.detected:
+        return render_intro(topic.branch, topic.subject, answer.question, selected=answer.subject)
+    return render_intro(answer.branch, answer.subject, answer.question)
+
+
+def render_json(answer, sections: dict) -> dict:
+    """The answer as plain data; ``sections`` is the topic's cached ``render_sections``."""
+    topic = answer.topic
+    return {
+        "branch": answer.branch,
+        "subject": answer.subject,
+        "question": answer.question,
+        "topic": topic.id,
+        "matched": topic.matched,
+        "follow_up": answer.follow_up,
+        "answered_from": {"branch": topic.branch, "subject": topic.subject} if answer.detected else None,
+        "sections": sections,
+    }
+
+
+def render_sections(topic) -> dict:
+    """Plain-data view of a topic for JSON consumers."""
+    return {
+        "definition": topic.definition,
+        "examples": list(topic.examples),
+        "industry": topic.industry,
+        "keywords": list(topic.keywords),
+        "summary": topic.summary,
+    }
+
+
+# format -> (intro renderer, body renderer, separator); JSON is assembled by render_json
+_RENDERERS = {
+    "html": (render_html_intro, render_body, "\n"),
+    "markdown": (render_markdown_intro, render_markdown_body, "\n\n"),
+    "text": (render_text_intro, render_text_body, "\n\n"),
+    "json": (None, render_sections, None),
+}
+
+
+class FragmentStore:
+    """Rendered bodies per ``(branch, subject, topic)`` and format, rendered on first use."""
+
+    __slots__ = ("_rendered", "fingerprint")
+
+    def __init__(self, kb, maxsize: int = RENDERED_TOPICS):
+        self._rendered = LRUCache(maxsize)
+        # changes whenever any rendered answer can change: the content or this module
+        digest = hashlib.sha256(kb.fingerprint.encode("utf-8"))
+        with open(__file__, "rb") as fh:
+            digest.update(fh.read())
+        self.fingerprint = digest.hexdigest()[:16]
+
+    def __len__(self):
+        return len(self._rendered)
+
+    def body(self, topic, fmt: str = "html"):
+        key = (topic.key, fmt)
+        body = self._rendered.get(key)
+        if body is None:
+            body = _RENDERERS[fmt][1](topic)
+            self._rendered.put(key, body)
+        return body
+
+    def sections(self, topic) -> dict:
+        return self.body(topic, "json")
+
+    def render(self, answer, fmt: str = "html"):
+        """``answer`` in ``fmt`` (a ``FORMATS`` value): a string, or a dict for ``"json"``.
+
+        A topic detected in another subject is introduced as that subject.
+        """
+        if fmt == "json":
+            return render_json(answer, self.sections(answer.topic))
+        intro, _, separator = _RENDERERS[fmt]
+        return intro(answer) + separator + self.body(answer.topic, fmt)
@@ -0,0 +1,616 @@
+"""Ranked topic retrieval: BM25 over an inverted index of every topic.
+
+Each topic is indexed as one document with three weighted fields:
+
+* its trigger keywords, found in a doubt by a single Aho-Corasick pass so
+  phrases and word boundaries behave exactly as in ``matcher.py``;
+* its "Important Keywords" list;
+* its example and summary text.
+
+Postings store the final BM25 weight of a term in a document, so scoring a
+doubt is one ``numpy.bincount`` over the postings of its terms, followed by a
+heap-based top-k selection. A topic only ranks when a trigger or an Important
+Keywords term hit it, or when its text alone scores ``MIN_TEXT_SCORE``.
+Documents are grouped by ``(branch, subject)`` so a subject restriction is a
+slice of the score vector.
+
+``SubjectRouter`` applies the same scoring to trigger keywords only, across
+every subject at once, to tell which subject a doubt belongs to.
+
+``SampleIndex`` finds the known sample question closest to a doubt, comparing
+feature-hashed word and character n-gram vectors, with random-projection LSH
+buckets once there are too many questions to scan.
+
+Every index can be exported with ``to_state()`` as plain bytes and tuples and
+restored with ``from_state()``, so a prebuilt snapshot skips all of the above.
+NumPy is imported on first use, not at import time, and ``from_state()``
+of the router and the sample index keeps their arrays as bytes until the
+first lookup, so opening a prebuilt snapshot does not import it either.
+"""
+
+from __future__ import annotations
+
+import heapq
+import importlib.util
+import math
+import re
+import sys
+import zlib
+
+from matcher import KeywordMatcher
+
+
+def _lazy_import(name: str):
+    """Import ``name`` on first attribute access (importlib's ``LazyLoader``)."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+np = _lazy_import("numpy")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Field weights: a trigger hit is stronger evidence than a word in an example
+TRIGGER_WEIGHT = 3.0
+KEYWORD_WEIGHT = 1.0
+TEXT_WEIGHT = 1.0
+
+# A topic hit only by words from its example or summary text needs at least this
+# score to count as a match; one common word ("hello", "another") scores less
+MIN_TEXT_SCORE = 3.0
+
+# How a ranked topic was hit, weakest first
+TEXT_HIT = 0
+KEYWORD_HIT = 1
+TRIGGER_HIT = 2
+
+# Students tend to name the concept they are asking about first ("activation
+# functions in neural networks"), so the first trigger in a doubt counts extra
+FIRST_TRIGGER_BOOST = 1.25
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be between by can do does for from how i if in into is it its "
+    "me my of on or so than that the their them then there these this to use used uses "
+    "using vs was we what when where which while who why will with work works you your "
+    "explain example examples give tell difference different".split()
+)
+
+
+def stem(token: str) -> str:
+    """Crude suffix stripping so "sorting", "sorted" and "sorts" share a term."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 5 and token.endswith("ing"):
+        return token[:-3]
+    if len(token) > 4 and token.endswith("ed"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, split on non-alphanumerics, drop stopwords and stem."""
+    return [stem(t) for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _trigger_term(keyword: str) -> str:
+    # "#" never appears in a token, so trigger terms cannot collide with words
+    return "#" + keyword
+
+
+def _postings_state(terms: dict, postings: list) -> tuple:
+    """Terms in id order, all postings concatenated as raw bytes, and each term's bounds."""
+    bounds = [0]
+    for doc_ids, _ in postings:
+        bounds.append(bounds[-1] + len(doc_ids))
+    if postings:
+        doc_ids = np.concatenate([p[0] for p in postings]).astype(np.int32)
+        weights = np.concatenate([p[1] for p in postings]).astype(np.float32)
+    else:
+        doc_ids = np.empty(0, dtype=np.int32)
+        weights = np.empty(0, dtype=np.float32)
+    return tuple(sorted(terms, key=terms.get)), doc_ids.tobytes(), weights.tobytes(), tuple(bounds)
+
+
+def _postings_from_state(terms, doc_ids, weights, bounds):
+    # views into the two buffers; nothing is copied per term
+    doc_ids = np.frombuffer(doc_ids, dtype=np.int32)
+    weights = np.frombuffer(weights, dtype=np.float32)
+    postings = [(doc_ids[a:b], weights[a:b]) for a, b in zip(bounds, bounds[1:])]
+    return {term: i for i, term in enumerate(terms)}, postings
+
+
+class SearchIndex:
+    """BM25 index over an ordered sequence of topics.
+
+    ``topics`` must be grouped by ``(branch, subject)``; each topic needs
+    ``branch``, ``subject``, ``triggers``, ``keywords``, ``examples`` and
+    ``summary`` attributes.
+    """
+
+    __slots__ = ("topics", "spans", "_terms", "_postings", "_keyed", "_trigger_ids", "_triggers")
+
+    def __init__(self, topics):
+        self._set_topics(topics)
+        doc_terms = []
+        keyed = {}
+        trigger_words = set()
+        for doc_id, topic in enumerate(self.topics):
+            weights = {}
+            for keyword in topic.triggers:
+                term = _trigger_term(keyword.lower())
+                weights[term] = weights.get(term, 0.0) + TRIGGER_WEIGHT
+                trigger_words.add(keyword.lower())
+            for term in tokenize(" ".join(topic.keywords)):
+                weights[term] = weights.get(term, 0.0) + KEYWORD_WEIGHT
+                keyed.setdefault(term, set()).add(doc_id)
+            for term in tokenize(" ".join(topic.examples) + " " + topic.summary):
+                weights[term] = weights.get(term, 0.0) + TEXT_WEIGHT
+            doc_terms.append(weights)
+
+        # one automaton over every trigger keyword in every subject
+        self._triggers = KeywordMatcher((w, (w,)) for w in sorted(trigger_words))
+        terms, self._postings = self._build_postings(doc_terms)
+        self._set_terms(terms)
+        # per term, the topics that have it in their Important Keywords
+        empty = np.empty(0, dtype=np.int32)
+        self._keyed = [
+            np.array(sorted(keyed[term]), dtype=np.int32) if term in keyed else empty
+            for term in sorted(terms, key=terms.get)
+        ]
+
+    def _set_terms(self, terms: dict) -> None:
+        self._terms = terms
+        self._trigger_ids = frozenset(i for term, i in terms.items() if term.startswith("#"))
+
+    def _set_topics(self, topics) -> None:
+        self.topics = tuple(topics)
+        # (branch, subject) -> (start, stop) slice into self.topics
+        self.spans = {}
+        for doc_id, topic in enumerate(self.topics):
+            start, _ = self.spans.get((topic.branch, topic.subject), (doc_id, doc_id))
+            self.spans[(topic.branch, topic.subject)] = (start, doc_id + 1)
+
+    def to_state(self) -> tuple:
+        """The trigger automaton, postings and Important Keywords hits, as ``marshal``-able values."""
+        bounds = [0]
+        for doc_ids in self._keyed:
+            bounds.append(bounds[-1] + len(doc_ids))
+        keyed = np.concatenate(self._keyed).astype(np.int32) if self._keyed else np.empty(0, dtype=np.int32)
+        return (
+            (self._triggers.to_state(),) + _postings_state(self._terms, self._postings)
+            + (keyed.tobytes(), tuple(bounds))
+        )
+
+    @classmethod
+    def from_state(cls, topics, state) -> SearchIndex:
+        """Restore an index over ``topics`` (in the original order) from ``to_state()``."""
+        index = cls.__new__(cls)
+        index._set_topics(topics)
+        index._triggers = KeywordMatcher.from_state(state[0])
+        terms, index._postings = _postings_from_state(*state[1:5])
+        index._set_terms(terms)
+        keyed = np.frombuffer(state[5], dtype=np.int32)
+        index._keyed = [keyed[a:b] for a, b in zip(state[6], state[6][1:])]
+        return index
+
+    @staticmethod
+    def _build_postings(doc_terms):
+        n_docs = len(doc_terms)
+        lengths = np.array([sum(w.values()) for w in doc_terms], dtype=np.float64)
+        avg_length = float(lengths.mean()) if n_docs else 0.0
+        norm = K1 * (1 - B + B * lengths / avg_length) if n_docs else lengths
+
+        by_term = {}
+        for doc_id, weights in enumerate(doc_terms):
+            for term, tf in weights.items():
+                by_term.setdefault(term, []).append((doc_id, tf))
+
+        terms = {}
+        postings = []
+        for term, entries in by_term.items():
+            doc_ids = np.fromiter((d for d, _ in entries), dtype=np.int32, count=len(entries))
+            tf = np.fromiter((t for _, t in entries), dtype=np.float64, count=len(entries))
+            idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            weight = idf * tf * (K1 + 1) / (tf + norm[doc_ids])
+            terms[term] = len(postings)
+            postings.append((doc_ids, weight.astype(np.float32)))
+        return terms, postings
+
+    def __len__(self):
+        return len(self.topics)
+
+    def query_terms(self, text: str) -> list:
+        """``(term id, query weight)`` pairs for normalized doubt ``text``.
+
+        Trigger hits come first, in the order they appear, followed by the
+        stemmed tokens; terms missing from the index are dropped.
+        """
+        lookup = self._terms
+        query = []
+        for keyword in self._triggers.find_all(text):
+            term_id = lookup.get(_trigger_term(keyword))
+            if term_id is not None:
+                query.append((term_id, FIRST_TRIGGER_BOOST if not query else 1.0))
+        for token in tokenize(text):
+            term_id = lookup.get(token)
+            if term_id is not None:
+                query.append((term_id, 1.0))
+        return query
+
+    def scores(self, text: str) -> tuple:
+        """BM25 score of every indexed topic for ``text``, and how each was hit
+        (``TRIGGER_HIT``, ``KEYWORD_HIT`` or ``TEXT_HIT``)."""
+        query = self.query_terms(text)
+        hits = np.full(len(self.topics), TEXT_HIT, dtype=np.int8)
+        if not query:
+            return np.zeros(len(self.topics), dtype=np.float32), hits
+        postings = self._postings
+        doc_ids = np.concatenate([postings[t][0] for t, _ in query])
+        weights = np.concatenate([postings[t][1] * w if w != 1.0 else postings[t][1] for t, w in query])
+        for term_id, _ in query:
+            hits[self._keyed[term_id]] = KEYWORD_HIT
+        # after the keyword hits, so a trigger hit wins
+        for term_id, _ in query:
+            if term_id in self._trigger_ids:
+                hits[postings[term_id][0]] = TRIGGER_HIT
+        return np.bincount(doc_ids, weights=weights, minlength=len(self.topics)), hits
+
+    def top_k(self, scores: np.ndarray, hits: np.ndarray, k: int = 3, span=None) -> list:
+        """Return up to ``k`` ``(topic, score, hit)`` triples, best first, for the
+        topics a trigger or Important Keywords term hit or whose text alone
+        scores at least ``MIN_TEXT_SCORE``.
+
+        ``span`` restricts the selection to a ``(start, stop)`` range of topics.
+        Ties keep index order, so earlier topics in the source file win.
+        """
+        start, stop = span if span is not None else (0, len(self.topics))
+        window = scores[start:stop]
+        matched = (window > 0) & ((hits[start:stop] != TEXT_HIT) | (window >= MIN_TEXT_SCORE))
+        best = heapq.nlargest(k, np.flatnonzero(matched).tolist(), key=window.__getitem__)
+        return [(self.topics[start + i], float(window[i]), int(hits[start + i])) for i in best]
+
+    def rank(self, branch: str, subject: str, text: str, k: int = 3) -> list:
+        """Top ``k`` ``(topic, score, hit)`` of one subject for normalized doubt ``text``."""
+        span = self.spans.get((branch, subject))
+        if span is None:
+            return []
+        return self.top_k(*self.scores(text), k, span)
+
+
+class SubjectRouter:
+    """Trigger-only BM25 over the topics of every subject, for subject detection.
+
+    ``entries`` are ``(branch, subject, topic id, triggers)`` tuples grouped by
+    ``(branch, subject)``. One scoring pass gives every topic a score, and a
+    ``reduceat`` over the subject boundaries gives each subject its best one.
+    """
+
+    __slots__ = ("keys", "topic_ids", "_starts", "_terms", "_postings", "_triggers", "_state")
+
+    def __init__(self, entries):
+        self.keys = []
+        self.topic_ids = []
+        starts = []
+        doc_terms = []
+        trigger_words = set()
+        for branch, subject, topic_id, triggers in entries:
+            if not self.keys or self.keys[-1] != (branch, subject):
+                self.keys.append((branch, subject))
+                starts.append(len(self.topic_ids))
+            self.topic_ids.append(topic_id)
+            weights = {}
+            for keyword in triggers:
+                term = _trigger_term(keyword.lower())
+                weights[term] = weights.get(term, 0.0) + TRIGGER_WEIGHT
+                trigger_words.add(keyword.lower())
+            doc_terms.append(weights)
+        self.keys = tuple(self.keys)
+        self.topic_ids = tuple(self.topic_ids)
+        self._starts = np.array(starts, dtype=np.intp)
+        self._triggers = KeywordMatcher((w, (w,)) for w in sorted(trigger_words))
+        self._terms, self._postings = SearchIndex._build_postings(doc_terms)
+        self._state = None
+
+    def to_state(self) -> tuple:
+        """Subjects, topic ids, trigger automaton and postings, as ``marshal``-able values."""
+        self._restore()
+        return (
+            self.keys, self.topic_ids, tuple(int(s) for s in self._starts), self._triggers.to_state(),
+        ) + _postings_state(self._terms, self._postings)
+
+    @classmethod
+    def from_state(cls, state) -> SubjectRouter:
+        """Restore a router from ``to_state()``. The postings stay raw bytes until the
+        first detection, so opening a build does not import NumPy."""
+        router = cls.__new__(cls)
+        keys, topic_ids, _, matcher = state[:4]
+        router.keys = tuple(tuple(key) for key in keys)
+        router.topic_ids = tuple(topic_ids)
+        router._triggers = KeywordMatcher.from_state(matcher)
+        router._state = state
+        return router
+
+    def _restore(self) -> None:
+        state = self._state
+        if state is not None:
+            self._starts = np.array(state[2], dtype=np.intp)
+            self._terms, self._postings = _postings_from_state(*state[4:])
+            # cleared last: a thread that sees None also sees the fields
+            self._state = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def detect(self, text: str):
+        """Best ``(branch, subject, topic id, score, confidence)`` for normalized ``text``.
+
+        ``confidence`` is the winning subject's share of the summed per-subject
+        best scores: 1.0 when only one subject has a trigger in the doubt, near
+        ``1 / n`` when ``n`` subjects match equally well. None when no trigger
+        matches at all.
+        """
+        self._restore()
+        query = []
+        for keyword in self._triggers.find_all(text):
+            term_id = self._terms.get(_trigger_term(keyword))
+            if term_id is not None:
+                query.append((term_id, FIRST_TRIGGER_BOOST if not query else 1.0))
+        if not query:
+            return None
+        postings = self._postings
+        doc_ids = np.concatenate([postings[t][0] for t, _ in query])
+        weights = np.concatenate([postings[t][1] * w if w != 1.0 else postings[t][1] for t, w in query])
+        scores = np.bincount(doc_ids, weights=weights, minlength=len(self.topic_ids))
+        best_per_subject = np.maximum.reduceat(scores, self._starts)
+        winner = int(best_per_subject.argmax())
+        start = int(self._starts[winner])
+        stop = int(self._starts[winner + 1]) if winner + 1 < len(self._starts) else len(self.topic_ids)
+        doc = start + int(scores[start:stop].argmax())
+        best = float(best_per_subject[winner])
+        branch, subject = self.keys[winner]
+        return branch, subject, self.topic_ids[doc], best, best / float(best_per_subject.sum())
+
+
+# Sample question vectors: hashed features in this many dimensions
+SAMPLE_DIMENSIONS = 1024
+
+# Relative weight of each feature kind; character trigrams keep a misspelled or
+# inflected word close to the original, words and word pairs carry the meaning
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 0.5
+TRIGRAM_WEIGHT = 1.0
+
+# Below this many questions a full scan is cheaper than hashing into buckets
+EXACT_SCAN_LIMIT = 512
+
+# Random-projection LSH: tables of this many hyperplane bits each. With 5000
+# questions this scores about 250 candidates and finds the exact nearest one
+# for nearly every lightly misspelled or shortened question
+LSH_TABLES = 16
+LSH_BITS = 12
+LSH_SEED = 20240601
+
+# Rows densified at a time while hashing them into the LSH tables
+LSH_BLOCK = 256
+
+
+def sample_features(text: str) -> dict:
+    """Weighted features of normalized ``text``: stemmed words, word pairs and
+    the character trigrams of each word."""
+    tokens = tokenize(text)
+    features = {}
+    for token in tokens:
+        features["w:" + token] = features.get("w:" + token, 0.0) + WORD_WEIGHT
+        padded = f"^{token}$"
+        for i in range(len(padded) - 2):
+            key = "c:" + padded[i:i + 3]
+            features[key] = features.get(key, 0.0) + TRIGRAM_WEIGHT
+    for pair in zip(tokens, tokens[1:]):
+        key = "b:" + " ".join(pair)
+        features[key] = features.get(key, 0.0) + BIGRAM_WEIGHT
+    return features
+
+
+def sample_vector(text: str, dimensions: int = SAMPLE_DIMENSIONS):
+    """Unit-length hashed feature vector of ``text`` (all zeros if it has no features).
+
+    Each feature lands in ``crc32 % dimensions`` with a sign from the hash's top
+    bit, so colliding features tend to cancel instead of piling up. CRC-32 is
+    stable across processes, unlike ``hash()``, so vectors built at compile
+    time match the ones built per query.
+    """
+    features = sample_features(text)
+    hashes = [zlib.crc32(f.encode("utf-8")) for f in features]
+    buckets = np.fromiter((h % dimensions for h in hashes), dtype=np.intp, count=len(hashes))
+    weights = np.fromiter(
+        (w if h >> 31 else -w for h, w in zip(hashes, features.values())), dtype=np.float64, count=len(hashes)
+    )
+    vector = np.bincount(buckets, weights=weights, minlength=dimensions)
+    norm = float(np.sqrt(vector @ vector))
+    return (vector / norm if norm else vector).astype(np.float32)
+
+
+class SampleIndex:
+    """Nearest known question for a doubt, by cosine similarity of hashed vectors.
+
+    ``entries`` are ``(branch, subject, question, topic id)`` tuples. Every
+    question is one row of a unit-vector matrix. Up to ``EXACT_SCAN_LIMIT``
+    rows a query is a single matrix-vector product; past that, rows are also
+    hashed into ``LSH_TABLES`` tables by the signs of ``LSH_BITS`` random
+    projections, and only rows sharing a bucket (or one bit away from it) with
+    the query are scored. The LSH search is approximate: a near neighbour can be
+    missed, never a wrong one returned.
+
+    Rows are stored sparse and scored straight from the sparse arrays, so no
+    dense matrix is ever kept; the hash tables are built on first use.
+    """
+
+    __slots__ = ("keys", "topic_ids", "questions", "_rows", "_key_of", "_row_of", "_planes", "_tables", "_state")
+
+    def __init__(self, entries):
+        keys = {}
+        key_of = []
+        topic_ids = []
+        questions = []
+        indptr = [0]
+        indices = []
+        values = []
+        for branch, subject, question, topic_id in entries:
+            key_of.append(keys.setdefault((branch, subject), len(keys)))
+            topic_ids.append(topic_id)
+            questions.append(question)
+            vector = sample_vector(question)
+            nonzero = np.flatnonzero(vector)
+            indices.append(nonzero.astype(np.int32))
+            values.append(vector[nonzero])
+            indptr.append(indptr[-1] + len(nonzero))
+        self.keys = tuple(keys)
+        self.topic_ids = tuple(topic_ids)
+        self.questions = tuple(questions)
+        self._key_of = np.array(key_of, dtype=np.int32)
+        self._rows = (
+            np.array(indptr, dtype=np.int64),
+            np.concatenate(indices) if indices else np.empty(0, dtype=np.int32),
+            np.concatenate(values) if values else np.empty(0, dtype=np.float32),
+        )
+        self._row_of = self._planes = self._tables = self._state = None
+
+    def to_state(self) -> tuple:
+        """Questions, their topics and their sparse vectors, as ``marshal``-able values."""
+        self._restore()
+        indptr, indices, values = self._rows
+        return (
+            self.keys, self.topic_ids, self.questions, self._key_of.tobytes(),
+            indptr.tobytes(), indices.astype(np.int32).tobytes(), values.astype(np.float32).tobytes(),
+        )
+
+    @classmethod
+    def from_state(cls, state) -> SampleIndex:
+        """Restore an index from ``to_state()``; the vectors stay raw bytes until the
+        first lookup, so opening a build does not import NumPy."""
+        index = cls.__new__(cls)
+        keys, topic_ids, questions = state[:3]
+        index.keys = tuple(tuple(key) for key in keys)
+        index.topic_ids = tuple(topic_ids)
+        index.questions = tuple(questions)
+        index._rows = index._key_of = index._row_of = index._planes = index._tables = None
+        index._state = state
+        return index
+
+    def _restore(self) -> None:
+        state = self._state
+        if state is not None:
+            key_of, indptr, indices, values = state[3:]
+            self._key_of = np.frombuffer(key_of, dtype=np.int32)
+            self._rows = (
+                np.frombuffer(indptr, dtype=np.int64),
+                np.frombuffer(indices, dtype=np.int32),
+                np.frombuffer(values, dtype=np.float32),
+            )
+            # cleared last: a thread that sees None also sees the fields
+            self._state = None
+
+    def __len__(self):
+        return len(self.questions)
+
+    def _scores(self, vector):
+        """Dot product of ``vector`` with every row."""
+        indptr, indices, values = self._rows
+        if self._row_of is None:
+            self._row_of = np.repeat(np.arange(len(self.questions), dtype=np.int32), np.diff(indptr))
+        return np.bincount(self._row_of, weights=values * vector[indices], minlength=len(self.questions))
+
+    def _row_scores(self, rows, vector):
+        """Dot product of ``vector`` with each of ``rows``."""
+        indptr, indices, values = self._rows
+        starts = indptr[rows]
+        lengths = indptr[rows + 1] - starts
+        # positions of the rows' values in the flat arrays, row after row
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(int(lengths.sum())) + np.repeat(starts - offsets, lengths)
+        owner = np.repeat(np.arange(len(rows)), lengths)
+        return np.bincount(owner, weights=values[positions] * vector[indices[positions]], minlength=len(rows))
+
+    def _projections(self, planes):
+        """``planes`` applied to every row, densifying ``LSH_BLOCK`` rows at a time."""
+        indptr, indices, values = self._rows
+        n = len(self.questions)
+        projections = np.empty((n, len(planes)), dtype=np.float32)
+        block = np.zeros((LSH_BLOCK, SAMPLE_DIMENSIONS), dtype=np.float32)
+        for lo in range(0, n, LSH_BLOCK):
+            hi = min(lo + LSH_BLOCK, n)
+            first, last = indptr[lo], indptr[hi]
+            rows = np.repeat(np.arange(hi - lo), np.diff(indptr[lo:hi + 1]))
+            block[:hi - lo] = 0.0
+            block[rows, indices[first:last]] = values[first:last]
+            projections[lo:hi] = block[:hi - lo] @ planes.T
+        return projections
+
+    def _lsh(self):
+        """Hyperplanes and, per table, bucket code -> row ids; built on first use."""
+        if self._tables is None:
+            rng = np.random.default_rng(LSH_SEED)
+            planes = rng.standard_normal((LSH_TABLES * LSH_BITS, SAMPLE_DIMENSIONS)).astype(np.float32)
+            codes = self._codes(self._projections(planes))
+            tables = []
+            for column in codes.T:
+                order = np.argsort(column, kind="stable")
+                values, starts = np.unique(column[order], return_index=True)
+                tables.append(dict(zip(values.tolist(), np.split(order, starts[1:]))))
+            # assigned last: another thread sees either nothing or both
+            self._planes = planes
+            self._tables = tables
+        return self._planes, self._tables
+
+    @staticmethod
+    def _codes(projections):
+        # (rows, tables * bits) projections -> (rows, tables) integer codes
+        bits = (projections > 0).reshape(len(projections), LSH_TABLES, LSH_BITS)
+        return bits @ (1 << np.arange(LSH_BITS))
+
+    def candidates(self, vector):
+        """Row ids that share a bucket with ``vector``, or lie one bit from it, in any table."""
+        planes, tables = self._lsh()
+        codes = self._codes((planes @ vector)[None, :])[0].tolist()
+        found = []
+        for table, code in zip(tables, codes):
+            for probe in [code] + [code ^ (1 << b) for b in range(LSH_BITS)]:
+                rows = table.get(probe)
+                if rows is not None:
+                    found.append(rows)
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.intp)
+
+    def nearest(self, text: str):
+        """Closest ``(branch, subject, topic id, question, similarity)`` to normalized
+        ``text``, or None when nothing shares a feature with it."""
+        if not self.questions:
+            return None
+        self._restore()
+        vector = sample_vector(text)
+        if len(self.questions) <= EXACT_SCAN_LIMIT:
+            rows = None
+            similarities = self._scores(vector)
+        else:
+            rows = self.candidates(vector)
+            if not len(rows):
+                return None
+            similarities = self._row_scores(rows, vector)
+        best = int(similarities.argmax())
+        similarity = float(similarities[best])
+        if similarity <= 0.0:
+            return None
+        row = best if rows is None else int(rows[best])
+        branch, subject = self.keys[self._key_of[row]]
+        return branch, subject, self.topic_ids[row], self.questions[row], similarity
@@ -0,0 +1,312 @@
+"""Compiled, memory-mapped knowledge shards.
+
+``compile_shards`` turns the JSON sources into one binary file per branch plus
+a small manifest. A branch file is a fixed header, an offset table with one
+entry per subject, and one ``marshal`` payload per subject:
+
+    header   magic, format version, marshal version, subject count
+    table    (offset, length, crc32) per subject, in display order
+    payload  marshal-encoded subject record, including its compiled BM25 index
+
+The manifest is a header (magic, format version, marshal version, SHA-256 of
+the body) followed by the body: branches, subject names, sample doubts, and
+the compiled spelling index, subject router, sample question index and
+typeahead index. Nothing is rebuilt at load time; every index is restored
+from its ``to_state()`` form.
+
+``open_shards`` checks and reads only the manifest and maps the branch files.
+A subject is decoded from the mapping the first time it is asked for, its
+checksum verified and its short strings interned, and then lives in the
+knowledge base's bounded resident set. Untouched subjects cost nothing but
+page cache, which the kernel shares between workers and can reclaim.
+
+Shards are written to ``<build dir>/<source version>-f<format>/`` and reused
+when a directory for the same sources already exists, so restarts and other
+workers skip the JSON entirely.
+"""
+
+import hashlib
+import marshal
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+
+from knowledge import (
+    RESIDENT_SUBJECTS, KnowledgeBase, Subject, Topic, read_sources, router_entries, sample_entries,
+)
+from search import SampleIndex, SearchIndex, SubjectRouter
+from spelling import SpellIndex, build_vocabulary
+from suggest import SuggestIndex, suggestion_entries
+
+SHARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "shards")
+
+MAGIC = b"DSKS"
+MANIFEST_MAGIC = b"DSKM"
+FORMAT_VERSION = 7
+MARSHAL_VERSION = 4
+
+_HEADER = struct.Struct("<4sHHI")
+_ENTRY = struct.Struct("<QII")
+_MANIFEST_HEADER = struct.Struct("<4sHH32s")
+
+MANIFEST = "manifest.bin"
+
+# Compiled versions kept on disk; older ones are removed after a build
+KEEP_VERSIONS = 2
+
+
+def _topic_record(topic) -> tuple:
+    return (
+        topic.id, topic.triggers, topic.definition, topic.examples,
+        topic.industry, topic.keywords, topic.summary,
+    )
+
+
+def _intern_all(values) -> tuple:
+    return tuple(sys.intern(v) for v in values)
+
+
+def _topic(branch, subject, record) -> Topic:
+    topic_id, triggers, definition, examples, industry, keywords, summary = record
+    # ids and keywords repeat across subjects and are used as dict keys; long text is not interned
+    return Topic(
+        branch, subject, sys.intern(topic_id), _intern_all(triggers), definition,
+        examples, industry, _intern_all(keywords), summary,
+    )
+
+
+def _write_branch(path, subjects) -> int:
+    """Write one branch file and return its size in bytes."""
+    payloads = [
+        marshal.dumps(
+            (s.name, tuple(_topic_record(t) for t in s.topics), _topic_record(s.overview), s.index.to_state()),
+            MARSHAL_VERSION,
+        )
+        for s in subjects
+    ]
+    offset = _HEADER.size + _ENTRY.size * len(payloads)
+    with open(path, "wb") as fh:
+        fh.write(_HEADER.pack(MAGIC, FORMAT_VERSION, MARSHAL_VERSION, len(payloads)))
+        for payload in payloads:
+            fh.write(_ENTRY.pack(offset, len(payload), zlib.crc32(payload)))
+            offset += len(payload)
+        for payload in payloads:
+            fh.write(payload)
+    return offset
+
+
+def _write_manifest(path, manifest: dict) -> None:
+    body = marshal.dumps(manifest, MARSHAL_VERSION)
+    with open(path, "wb") as fh:
+        fh.write(_MANIFEST_HEADER.pack(MANIFEST_MAGIC, FORMAT_VERSION, MARSHAL_VERSION, hashlib.sha256(body).digest()))
+        fh.write(body)
+
+
+def read_manifest(path: str) -> dict:
+    """The verified manifest of the build at ``path``; ValueError if it is not a usable build."""
+    try:
+        with open(os.path.join(path, MANIFEST), "rb") as fh:
+            data = fh.read()
+    except OSError as exc:
+        raise ValueError(f"{path}: no manifest ({exc.strerror})") from None
+    if len(data) < _MANIFEST_HEADER.size:
+        raise ValueError(f"{path}: truncated manifest")
+    magic, fmt, marshal_version, digest = _MANIFEST_HEADER.unpack_from(data)
+    if magic != MANIFEST_MAGIC or fmt != FORMAT_VERSION or marshal_version != MARSHAL_VERSION:
+        raise ValueError(f"{path}: not a format {FORMAT_VERSION} shard build")
+    body = memoryview(data)[_MANIFEST_HEADER.size:]
+    if hashlib.sha256(body).digest() != digest:
+        raise ValueError(f"{path}: manifest checksum mismatch")
+    return marshal.loads(body)
+
+
+def build_path(out_dir: str, version: str) -> str:
+    """Where the build of source ``version`` lives under ``out_dir``."""
+    return os.path.join(out_dir, f"{version}-f{FORMAT_VERSION}")
+
+
+def compile_shards(directory: str, out_dir: str, version: str) -> str:
+    """Compile the sources under ``directory`` into ``out_dir`` and return the shard path.
+
+    An existing build of the same ``version`` is reused. The build goes to a
+    temporary directory that is renamed into place, so concurrent builders of
+    the same version are safe and readers never see a partial build.
+    """
+    target = build_path(out_dir, version)
+    if os.path.exists(os.path.join(target, MANIFEST)):
+        return target
+
+    branches, subjects, fallback = read_sources(directory)
+    os.makedirs(out_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".build-", dir=out_dir)
+    try:
+        os.chmod(tmp, 0o755)
+        manifest_branches = []
+        for i, (branch, names) in enumerate(branches.items()):
+            filename = f"branch-{i:04d}.shard"
+            entries = [subjects[(branch, name)] for name in names]
+            size = _write_branch(os.path.join(tmp, filename), entries)
+            manifest_branches.append(
+                (branch, filename, size, tuple((s.name, s.samples, len(s.topics) + 1) for s in entries))
+            )
+        speller = SpellIndex(*build_vocabulary(t for s in subjects.values() for t in s.topics + (s.overview,)))
+        ordered = [subjects[(b, n)] for b, names in branches.items() for n in names]
+        router = SubjectRouter(router_entries(ordered))
+        similar = SampleIndex(sample_entries(ordered))
+        suggester = SuggestIndex(suggestion_entries(ordered))
+        _write_manifest(os.path.join(tmp, MANIFEST), {
+            "format": FORMAT_VERSION,
+            "version": version,
+            "fallback": _topic_record(fallback),
+            "branches": tuple(manifest_branches),
+            "spelling": speller.to_state(),
+            "router": router.to_state(),
+            "similar": similar.to_state(),
+            "suggest": suggester.to_state(),
+        })
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            # another process finished the same build first
+            if not os.path.exists(os.path.join(target, MANIFEST)):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    prune_shards(out_dir, keep=target)
+    return target
+
+
+def prune_shards(out_dir: str, keep: str, versions: int = KEEP_VERSIONS) -> None:
+    """Remove all but the newest ``versions`` builds, never ``keep``.
+
+    Workers still serving a removed build keep working: ``open_shards`` maps
+    every branch file up front, and mappings stay valid after the files are
+    unlinked.
+    """
+    builds = [
+        os.path.join(out_dir, name) for name in os.listdir(out_dir)
+        if not name.startswith(".") and os.path.isdir(os.path.join(out_dir, name))
+    ]
+    builds.sort(key=os.path.getmtime, reverse=True)
+    for path in builds[versions:]:
+        if os.path.abspath(path) != os.path.abspath(keep):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class ShardReader:
+    """Memory-mapped branch files of one compiled build; decodes subjects on demand."""
+
+    __slots__ = ("path", "version", "_locations", "_maps", "_lock")
+
+    def __init__(self, path: str, manifest: dict):
+        self.path = path
+        self.version = manifest["version"]
+        # (branch, subject) -> (branch file, position in its offset table)
+        self._locations = {}
+        for branch, filename, _, subjects in manifest["branches"]:
+            for position, (name, _, _) in enumerate(subjects):
+                self._locations[(branch, name)] = (filename, position)
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def _map(self, filename: str) -> mmap.mmap:
+        mapped = self._maps.get(filename)
+        if mapped is None:
+            with self._lock:
+                mapped = self._maps.get(filename)
+                if mapped is None:
+                    with open(os.path.join(self.path, filename), "rb") as fh:
+                        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                    magic, fmt, marshal_version, _ = _HEADER.unpack_from(mapped)
+                    if magic != MAGIC or fmt != FORMAT_VERSION or marshal_version != MARSHAL_VERSION:
+                        raise ValueError(f"{filename}: not a format {FORMAT_VERSION} shard")
+                    self._maps[filename] = mapped
+        return mapped
+
+    def map_all(self) -> None:
+        """Map every branch file now, so a later prune cannot pull one away.
+
+        Mapping reads nothing but the header; pages are faulted in on use.
+        """
+        for filename, _ in set(self._locations.values()):
+            self._map(filename)
+
+    def load(self, branch: str, name: str, samples: tuple) -> Subject:
+        filename, position = self._locations[(branch, name)]
+        mapped = self._map(filename)
+        offset, length, crc = _ENTRY.unpack_from(mapped, _HEADER.size + position * _ENTRY.size)
+        payload = mapped[offset:offset + length]
+        if zlib.crc32(payload) != crc:
+            raise ValueError(f"{filename}: entry {position} ({name!r}) is corrupt")
+        stored_name, topics, overview, index = marshal.loads(payload)
+        if stored_name != name:
+            raise ValueError(f"{filename}: entry {position} is {stored_name!r}, expected {name!r}")
+        topics = tuple(_topic(branch, name, record) for record in topics)
+        overview = _topic(branch, name, overview)
+        return Subject(
+            branch, name, samples, topics, overview, SearchIndex.from_state(topics + (overview,), index),
+        )
+
+
+def open_shards(path: str, resident: int = RESIDENT_SUBJECTS) -> KnowledgeBase:
+    """A ``KnowledgeBase`` over a compiled build; only the manifest is read up front.
+
+    The manifest checksum and the size of every branch file are checked here,
+    so a damaged or partly copied build fails with ValueError before serving.
+    Every branch file is mapped here too (its header checked, nothing else read),
+    so the build keeps working for this process after it is pruned.
+    """
+    manifest = read_manifest(path)
+    reader = ShardReader(path, manifest)
+    branches = {}
+    samples = {}
+    topic_count = 0
+    for branch, filename, size, subjects in manifest["branches"]:
+        try:
+            actual = os.path.getsize(os.path.join(path, filename))
+        except OSError:
+            actual = None
+        if actual != size:
+            raise ValueError(f"{path}: {filename} is {actual} bytes, expected {size}")
+        branch = sys.intern(branch)
+        names = []
+        for name, subject_samples, n_topics in subjects:
+            name = sys.intern(name)
+            names.append(name)
+            samples[(branch, name)] = subject_samples
+            topic_count += n_topics
+        branches[branch] = tuple(names)
+    reader.map_all()
+
+    return KnowledgeBase(
+        branches,
+        samples,
+        _topic("", "", manifest["fallback"]),
+        lambda branch, name: reader.load(branch, name, samples[(branch, name)]),
+        topic_count,
+        SpellIndex.from_state(manifest["spelling"]),
+        SubjectRouter.from_state(manifest["router"]),
+        fingerprint=reader.version,
+        resident=resident,
+        similar=SampleIndex.from_state(manifest["similar"]),
+        suggester=SuggestIndex.from_state(manifest["suggest"]),
+    )
+
+
+def open_build(directory: str, out_dir: str, version: str, resident: int = RESIDENT_SUBJECTS) -> KnowledgeBase:
+    """Open the compiled build of ``version``, compiling it first if needed.
+
+    A build that exists but fails validation is discarded and compiled again
+    once; a second failure is raised.
+    """
+    path = compile_shards(directory, out_dir, version)
+    try:
+        return open_shards(path, resident)
+    except ValueError:
+        shutil.rmtree(path, ignore_errors=True)
+    return open_shards(compile_shards(directory, out_dir, version), resident)
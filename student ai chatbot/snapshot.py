@@ -0,0 +1,249 @@
+"""Immutable compiled snapshots of the knowledge base, with hot reload.
+
+Everything derived from the JSON sources (compiled subject shards, rendered
+fragments, catalog asset) is built together into one ``Snapshot``. ``SnapshotHolder``
+keeps the current one in a single attribute: request handlers read it once and
+use it for the whole request, and a rebuild swaps in a finished snapshot with
+one reference assignment. Readers never take a lock or see a half-built index.
+
+The compiled shards can also be built ahead of time, e.g. in a deploy step, so
+a starting worker only maps them:
+
+    python snapshot.py             compile (or reuse) the build for the current sources
+    python snapshot.py --verify    also decode every subject and check its checksum
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+from assets import catalog_asset
+from knowledge import KNOWLEDGE_DIR, RESIDENT_SUBJECTS
+from render import FragmentStore
+from shards import SHARD_DIR, build_path, compile_shards, open_build, open_shards
+
+log = logging.getLogger(__name__)
+
+
+def source_files(directory: str = KNOWLEDGE_DIR) -> list:
+    """Every JSON source the knowledge base is built from, in a stable order."""
+    branch_dir = os.path.join(directory, "branches")
+    files = [os.path.join(directory, "defaults.json")]
+    files.extend(
+        os.path.join(branch_dir, name) for name in sorted(os.listdir(branch_dir)) if name.endswith(".json")
+    )
+    return files
+
+
+def source_stamp(directory: str = KNOWLEDGE_DIR) -> tuple:
+    """Cheap change detector: ``(path, mtime_ns, size)`` for every source file."""
+    stamp = []
+    for path in source_files(directory):
+        st = os.stat(path)
+        stamp.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def source_version(directory: str = KNOWLEDGE_DIR) -> str:
+    """Content hash of the sources; identical content gives the same version."""
+    digest = hashlib.sha256()
+    for path in source_files(directory):
+        digest.update(os.path.relpath(path, directory).encode("utf-8") + b"\0")
+        with open(path, "rb") as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()[:12]
+
+
+class Snapshot:
+    """Everything compiled from one version of the knowledge sources."""
+
+    __slots__ = (
+        "version", "generation", "knowledge", "fragments", "catalog", "page_version",
+        "built_at", "build_seconds", "stamp",
+    )
+
+    def __init__(self, version, generation, knowledge, fragments, catalog, page_salt, built_at, build_seconds, stamp):
+        self.version = version
+        self.generation = generation
+        self.knowledge = knowledge
+        self.fragments = fragments
+        self.catalog = catalog
+        # hash of everything a rendered page depends on besides the request itself
+        digest = hashlib.sha256(page_salt.encode("utf-8"))
+        digest.update(catalog.fingerprint.encode("utf-8"))
+        digest.update(fragments.fingerprint.encode("utf-8"))
+        self.page_version = digest.hexdigest()[:16]
+        self.built_at = built_at
+        self.build_seconds = build_seconds
+        self.stamp = stamp
+
+    @property
+    def branch_subjects(self) -> dict:
+        return self.knowledge.branch_subjects
+
+    @property
+    def sample_doubts(self) -> dict:
+        return self.knowledge.sample_doubts
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "generation": self.generation,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.built_at)),
+            "build_ms": round(self.build_seconds * 1000, 2),
+            "branches": len(self.knowledge.branches),
+            "subjects": len(self.knowledge.samples),
+            "topics": self.knowledge.topic_count,
+            "resident_subjects": self.knowledge.resident_stats(),
+        }
+
+
+def build_snapshot(
+    directory: str = KNOWLEDGE_DIR, generation: int = 1, page_salt: str = "",
+    build_dir: str = SHARD_DIR, resident: int = RESIDENT_SUBJECTS,
+) -> Snapshot:
+    """Compile the sources under ``directory``; raises ``ValueError``/``OSError`` on bad content.
+
+    Shards already compiled for the same sources are reused, so only the first
+    process to see a version parses the JSON.
+    """
+    start = time.perf_counter()
+    stamp = source_stamp(directory)
+    version = source_version(directory)
+    knowledge = open_build(directory, build_dir, version, resident)
+    fragments = FragmentStore(knowledge)
+    catalog = catalog_asset(knowledge)
+    return Snapshot(
+        version, generation, knowledge, fragments, catalog, page_salt,
+        time.time(), time.perf_counter() - start, stamp,
+    )
+
+
+class SnapshotHolder:
+    """Owns the current snapshot and rebuilds it when the sources change."""
+
+    def __init__(
+        self, directory: str = KNOWLEDGE_DIR, page_salt: str = "",
+        build_dir: str = SHARD_DIR, resident: int = RESIDENT_SUBJECTS,
+    ):
+        self.directory = directory
+        self.page_salt = page_salt
+        self.build_dir = build_dir
+        self.resident = resident
+        self.current = build_snapshot(directory, 1, page_salt, build_dir, resident)
+        self.reloads = 0
+        self.failures = 0
+        self._failed_stamp = None
+        self._rebuild_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild and swap in a new snapshot if the sources changed.
+
+        Returns True when a new snapshot was installed. A broken edit is logged
+        and counted, and the previous snapshot keeps serving.
+        """
+        with self._rebuild_lock:
+            old = self.current
+            try:
+                stamp = source_stamp(self.directory)
+            except OSError:
+                log.exception("knowledge sources unreadable; keeping version %s", old.version)
+                self.failures += 1
+                return False
+            if not force and (stamp == old.stamp or stamp == self._failed_stamp):
+                return False
+            try:
+                new = build_snapshot(
+                    self.directory, old.generation + 1, self.page_salt, self.build_dir, self.resident,
+                )
+            except (OSError, ValueError, KeyError):
+                log.exception("knowledge rebuild failed; keeping version %s", old.version)
+                self.failures += 1
+                self._failed_stamp = stamp
+                return False
+            self._failed_stamp = None
+            # the swap: a single reference assignment, atomic for readers
+            self.current = new
+            self.reloads += 1
+            log.info(
+                "knowledge snapshot %s (generation %d) built in %.1f ms",
+                new.version, new.generation, new.build_seconds * 1000,
+            )
+            return True
+
+    def watch(self, interval: float) -> None:
+        """Poll the sources every ``interval`` seconds from a daemon thread."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception:
+                    # whatever a bad edit breaks, keep watching so the next edit is picked up
+                    log.exception("knowledge reload crashed; keeping version %s", self.current.version)
+                    self.failures += 1
+
+        self._watcher = threading.Thread(target=run, name="knowledge-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def _directory_bytes(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compile the knowledge base into a snapshot build.")
+    parser.add_argument("--knowledge", default=KNOWLEDGE_DIR, help="directory with the JSON sources")
+    parser.add_argument("--out", default=SHARD_DIR, help="directory the builds are written to")
+    parser.add_argument("--force", action="store_true", help="recompile even if a build exists")
+    parser.add_argument("--verify", action="store_true", help="decode every subject after opening")
+    args = parser.parse_args(argv)
+
+    version = source_version(args.knowledge)
+    start = time.perf_counter()
+    if args.force:
+        shutil.rmtree(build_path(args.out, version), ignore_errors=True)
+    path = compile_shards(args.knowledge, args.out, version)
+    compiled = time.perf_counter()
+    try:
+        knowledge = open_shards(path)
+    except ValueError as exc:
+        print(f"invalid build: {exc}", file=sys.stderr)
+        return 1
+    opened = time.perf_counter()
+    if args.verify:
+        try:
+            for branch, name in knowledge.samples:
+                knowledge.subject(branch, name)
+        except ValueError as exc:
+            print(f"invalid build: {exc}", file=sys.stderr)
+            return 1
+    decoded = time.perf_counter()
+
+    print(f"{path}")
+    print(
+        f"  version {version}, {len(knowledge.branches)} branches, {len(knowledge.samples)} subjects, "
+        f"{knowledge.topic_count} topics, {_directory_bytes(path)} bytes"
+    )
+    timings = f"  compile {(compiled - start) * 1000:.1f} ms, open {(opened - compiled) * 1000:.1f} ms"
+    if args.verify:
+        timings += f", decode all {(decoded - opened) * 1000:.1f} ms"
+    print(timings)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Typo-tolerant lookup of trigger words with a symmetric-delete index.
+
+Every trigger word is stored under each string obtained by deleting up to
+``MAX_DISTANCE`` characters from it. A misspelled token generates its own
+deletes, and any word sharing one of them is a candidate; only those few
+candidates are checked with a real edit distance. Lookup cost depends on the
+token's length, not on the size of the vocabulary. Tokens longer than any
+trigger word could be within reach of are skipped outright, so the delete
+sets, whose size grows with the square of the length, stay small.
+
+Only tokens that appear nowhere in the knowledge base are corrected, and
+only towards trigger words with the same first letter (typos rarely hit the
+first letter, while different words often differ only there), so a correctly
+spelled word is never rewritten.
+"""
+
+import re
+
+from cache import LRUCache
+from search import STOPWORDS
+
+MAX_DISTANCE = 2
+
+# Shorter tokens are too ambiguous to correct ("tre" could be many things)
+MIN_WORD = 5
+
+# Tokens of this length or more may be two edits away; shorter ones only one.
+# Below that, two edits turn too many real words into trigger words
+# ("injection" and "reduction" are both two edits from "induction").
+LONG_WORD = 10
+
+# Corrections remembered per index, including "no correction"
+MEMO_SIZE = 4096
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def words(text: str) -> list:
+    return _WORD.findall(text.lower())
+
+
+def deletes(word: str, distance: int) -> set:
+    """``word`` plus every string made by deleting up to ``distance`` characters."""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps count as one edit).
+
+    Returns ``limit + 1`` as soon as the distance is known to exceed ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SpellIndex:
+    """Corrects unknown tokens to the closest trigger word.
+
+    ``targets`` maps each trigger word to how many topics use it (the tie
+    breaker between equally close candidates); ``known`` holds every other word
+    that should be left alone.
+    """
+
+    __slots__ = ("known", "counts", "_longest", "_deletes", "_memo")
+
+    def __init__(self, targets: dict, known=()):
+        self.counts = {w: n for w, n in targets.items() if len(w) >= MIN_WORD}
+        self.known = frozenset(known) | frozenset(targets) | STOPWORDS
+        self._longest = max(map(len, self.counts), default=0) + MAX_DISTANCE
+        self._deletes = {}
+        for word in self.counts:
+            for key in deletes(word, MAX_DISTANCE):
+                self._deletes.setdefault(key, []).append(word)
+        self._memo = LRUCache(MEMO_SIZE)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def to_state(self) -> tuple:
+        """Vocabulary and delete index as ``marshal``-able values."""
+        return self.counts, tuple(sorted(self.known)), {k: tuple(v) for k, v in self._deletes.items()}
+
+    @classmethod
+    def from_state(cls, state) -> "SpellIndex":
+        """Restore an index from ``to_state()`` without regenerating the deletes."""
+        index = cls.__new__(cls)
+        index.counts, known, index._deletes = state
+        index.known = frozenset(known)
+        index._longest = max(map(len, index.counts), default=0) + MAX_DISTANCE
+        index._memo = LRUCache(MEMO_SIZE)
+        return index
+
+    def lookup(self, token: str):
+        """The trigger word ``token`` most likely meant, or None."""
+        if not MIN_WORD <= len(token) <= self._longest or token in self.known:
+            return None
+        found = self._memo.get(token)
+        if found is not None:
+            return found or None
+        limit = 2 if len(token) >= LONG_WORD else 1
+        best = None
+        seen = set()
+        for key in deletes(token, limit):
+            for word in self._deletes.get(key, ()):
+                if word in seen or word[0] != token[0]:
+                    continue
+                seen.add(word)
+                distance = edit_distance(token, word, limit)
+                if distance <= limit:
+                    rank = (distance, -self.counts[word], word)
+                    if best is None or rank < best:
+                        best = rank
+        found = best[2] if best is not None else ""
+        self._memo.put(token, found)
+        return found or None
+
+    def correct(self, text: str) -> str:
+        """``text`` with every correctable token replaced by its trigger word."""
+        return _WORD.sub(lambda m: self.lookup(m.group()) or m.group(), text)
+
+
+def build_vocabulary(topics):
+    """``(targets, known)`` for ``SpellIndex`` from an iterable of topics."""
+    targets = {}
+    known = set()
+    for topic in topics:
+        for word in set(words(" ".join(topic.triggers))):
+            targets[word] = targets.get(word, 0) + 1
+        known.update(words(" ".join(topic.keywords + topic.examples)))
+        known.update(words(" ".join((topic.definition, topic.industry, topic.summary))))
+    known.difference_update(targets)
+    return targets, known
@@ -0,0 +1,148 @@
+"""Typeahead completions over sample doubts and topic trigger keywords.
+
+Every phrase is indexed under each of its words that is not a stopword, so
+"sema" completes both "semaphore" and "How do semaphores prevent race
+conditions?". The keys (the phrase from that word on, lowercased) are kept in
+one sorted list, and a typed prefix is a ``bisect`` range of it. Ranges too
+wide to scan per keystroke (short prefixes like "s") get their top
+completions precomputed when the index is built; any other range is small
+and is scanned directly. Either way a lookup is a couple of binary searches
+and a few dozen comparisons.
+
+Completions starting with the prefix come before ones where it begins a later
+word; within each group, sample doubts come first, then keywords used by more
+topics, then shorter phrases.
+"""
+
+import bisect
+import re
+
+from search import STOPWORDS
+
+# Completions returned per prefix
+MAX_SUGGESTIONS = 8
+
+# Prefixes matching more keys than this have their completions precomputed
+SCAN_LIMIT = 256
+
+# Shorter prefixes get no completions; longer ones are cut
+MIN_PREFIX = 2
+MAX_PREFIX = 100
+
+SAMPLE = 0
+KEYWORD = 1
+
+_SPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Sorts after any character in a key, so [prefix, prefix + _LAST) spans every key with that prefix
+_LAST = "\uffff"
+
+
+def normalize_prefix(text: str) -> str:
+    """Lowercase, single-spaced ``text`` without leading whitespace, as keys are stored."""
+    return _SPACE.sub(" ", text.lstrip()[:MAX_PREFIX * 2].lower())[:MAX_PREFIX]
+
+
+def suggestion_entries(subjects) -> list:
+    """``(phrase, kind, topics using it)`` for every sample doubt and trigger keyword."""
+    uses = {}
+    samples = {}
+    for s in subjects:
+        for sample in s.samples:
+            samples.setdefault(sample, 0)
+        for topic in s.topics + (s.overview,):
+            for keyword in topic.triggers:
+                uses[keyword] = uses.get(keyword, 0) + 1
+    return [(p, SAMPLE, 0) for p in samples] + [(k, KEYWORD, n) for k, n in uses.items() if k not in samples]
+
+
+class SuggestIndex:
+    """Sorted word-start keys over a fixed set of phrases, with precomputed
+    completions for the widest prefixes."""
+
+    __slots__ = ("phrases", "keys", "_entries", "_top")
+
+    def __init__(self, entries):
+        # best phrase first; a phrase's position is its rank
+        ordered = sorted(
+            {phrase: (kind, -uses, len(phrase), phrase) for phrase, kind, uses in entries}.items(),
+            key=lambda item: item[1],
+        )
+        self.phrases = tuple(phrase for phrase, _ in ordered)
+        keyed = []
+        n = len(self.phrases)
+        for rank, phrase in enumerate(self.phrases):
+            text = normalize_prefix(phrase)
+            for match in _WORD.finditer(text):
+                start = match.start()
+                if start and match.group() in STOPWORDS:
+                    continue
+                # a match inside the phrase ranks after every match at its start
+                keyed.append((text[start:], rank if not start else n + rank))
+        keyed.sort()
+        self.keys = tuple(key for key, _ in keyed)
+        self._entries = tuple(entry for _, entry in keyed)
+        self._top = {}
+        self._precompute()
+
+    def _precompute(self) -> None:
+        # every prefix of every key whose range is too wide to scan; there are few of
+        # them, since each one covers more than SCAN_LIMIT keys
+        for length in range(1, MAX_PREFIX + 1):
+            wide = False
+            i = 0
+            keys = self.keys
+            while i < len(keys):
+                if len(keys[i]) < length:
+                    i += 1
+                    continue
+                prefix = keys[i][:length]
+                hi = bisect.bisect_left(keys, prefix + _LAST, i)
+                if hi - i > SCAN_LIMIT:
+                    wide = True
+                    self._top[prefix] = self._select(i, hi)
+                i = hi
+            if not wide:
+                break
+
+    def _select(self, lo: int, hi: int) -> tuple:
+        ranked = sorted(set(self._entries[lo:hi]))
+        seen = set()
+        best = []
+        n = len(self.phrases)
+        for entry in ranked:
+            rank = entry % n
+            if rank not in seen:
+                seen.add(rank)
+                best.append(rank)
+                if len(best) == MAX_SUGGESTIONS:
+                    break
+        return tuple(best)
+
+    def to_state(self) -> tuple:
+        """Phrases, sorted keys and precomputed completions, as ``marshal``-able values."""
+        return self.phrases, self.keys, self._entries, self._top
+
+    @classmethod
+    def from_state(cls, state) -> "SuggestIndex":
+        index = cls.__new__(cls)
+        index.phrases, index.keys, index._entries, index._top = state
+        return index
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def complete(self, prefix: str, k: int = MAX_SUGGESTIONS) -> list:
+        """Up to ``k`` phrases with a word starting with ``prefix``, best first."""
+        prefix = normalize_prefix(prefix)
+        if len(prefix.strip()) < MIN_PREFIX:
+            return []
+        found = self._top.get(prefix)
+        if found is None:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + _LAST, lo)
+            if lo == hi:
+                return []
+            found = self._select(lo, hi)
+        return [self.phrases[rank] for rank in found[:k]]